@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the host analysis tooling on synthetic benchmark trees.
+
+A tree with one subdirectory per netem profile (as written by
+run_experiments.sh) is generated in KEMTLS or PQTLS naming, then every
+stage runs in its own process:
+
+    merge                   merge_benchmarks.main on the profile tree
+    get_benchmarks          cold parse of the merged directory (no cache)
+    get_benchmarks_cached   the same with a warm parse cache
+    build_average           on the parsed benchmarks
+    calc_additional_columns on the averages
+    filter_rom_report       on a synthetic rom_report with --rom-lines lines
+
+Reported are the best wall time of --repeat runs, files/s, records/s
+(name,value lines, of the merged files for all stages but
+filter_rom_report) and the peak RSS of the stage's process (worker
+processes of parallel parsing are not included). Results are appended as JSON lines to
+--results, and with --compare every stage is checked against the last
+result with the same configuration.
+
+Use:
+    bench_tooling.py [--pqtls] [--combinations N] [--iterations N] [--profiles N]
+                     [--metrics N] [--rom-lines N] [--repeat N] [--results FILE] [--compare [--threshold PCT]]
+"""
+import os
+import io
+import sys
+import json
+import time
+import runpy
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from itertools import product
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+KEMS = ["kyber512", "lightsaber", "ntruhps2048509"]
+SIGS = ["dilithium2", "falcon512", "rainbowIclassic"]
+# calc_additional_columns needs these, further profiles are made up
+PROFILES = ["1mbit_13msdelay", "1mbit_60msdelay", "46kbit_1500msdelay"]
+PROFILE_METRICS = ["cycles_connect", "ticks_connect", "cycles_send", "ticks_send", "cycles_recv", "ticks_recv"]
+ROM_MODULES = ["wolfssl", "PQM4", "ca_cert"]
+
+STAGES = [
+    "merge",
+    "get_benchmarks",
+    "get_benchmarks_cached",
+    "build_average",
+    "calc_additional_columns",
+    "filter_rom_report",
+]
+
+DEFAULT_RESULTS = "tooling_benchmarks.jsonl"
+DEFAULT_THRESHOLD = 20
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def combinations(pqtls, n):
+    """First n file name prefixes of the protocol, at most all 27."""
+    if pqtls:
+        # root, leaf, kex
+        combs = [f"{root}_{leaf}_{kex}" for root, leaf, kex in product(SIGS, SIGS, KEMS)]
+    else:
+        # kex, sig, kem
+        combs = [f"{kex}_{sig}_{kem}" for kex, sig, kem in product(KEMS, SIGS, KEMS)]
+    if n > len(combs):
+        raise ValueError(f"At most {len(combs)} combinations exist.")
+    return combs[:n]
+
+
+def profile_names(n):
+    return PROFILES[:n] + [f"{i}mbit_{i * 10}msdelay" for i in range(2, n - len(PROFILES) + 2)]
+
+
+def run_benchmarks(pqtls, n_metrics, rng):
+    """Lines of one run file, like recv_benchmarks.py writes them."""
+    lines = [
+        f"rom_size_wolfssl,{rng.randint(200000, 300000)}",
+        f"rom_size_PQM4,{rng.randint(50000, 90000)}",
+        f"rom_size_ca_cert,{rng.randint(1000, 5000)}",
+        f"elf_text_size,{rng.randint(250000, 350000)}",
+    ]
+    compute = ["make_keypair", "kem_dec"] + (["verify_hash_0", "verify_hash_1"] if pqtls else ["verify_hash", "kem_encapsulate"])
+    for name in ["peak_mem", "bytes_send", "bytes_received"] + [f"cycles_wc_pq_{c}" for c in compute]:
+        lines.append(f"{name},{rng.randint(1000, 100000)}")
+    for name in PROFILE_METRICS:
+        lines.append(f"{name},{rng.randint(10**6, 10**8)}")
+    lines.append(f"host_ms_total,{rng.random() * 1000:.3f}")
+    for i in range(max(0, n_metrics - len(lines))):
+        lines.append(f"extra_metric_{i},{rng.randint(0, 10**6)}")
+    lines.append("CMD_finish_success,y")
+    return lines
+
+
+def generate_tree(path, pqtls, n_combinations, iterations, n_profiles, n_metrics, seed=0):
+    """Writes the profile subdirectories, returns (files, records)."""
+    rng = random.Random(seed)
+    files = records = 0
+    for profile in profile_names(n_profiles):
+        os.makedirs(os.path.join(path, profile))
+        for comb in combinations(pqtls, n_combinations):
+            for i in range(1, iterations + 1):
+                lines = run_benchmarks(pqtls, n_metrics, rng)
+                with open(os.path.join(path, profile, f"{comb}_{i}.txt"), "w") as f:
+                    f.write("\n".join(lines) + "\n")
+                files += 1
+                records += len(lines)
+    return files, records
+
+
+def generate_rom_report(path, n_lines, seed=0):
+    rng = random.Random(seed)
+    lines = ["Path                                          Size       %"]
+    for i in range(n_lines):
+        name = ROM_MODULES[i] if i < len(ROM_MODULES) else f"module_{i}"
+        lines.append(f"{'  ' * (i % 4)}├── {name:40} {rng.randint(10, 200000):8}  {rng.random() * 10:5.2f}%")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def count_records(path):
+    """Lines of all benchmark files in path."""
+    records = 0
+    for fname in os.listdir(path):
+        with open(os.path.join(path, fname), "rb") as f:
+            records += f.read().count(b"\n")
+    return records
+
+
+def run_stage(stage, work, pqtls):
+    """Runs in the stage's own process, returns the seconds the stage took."""
+    sys.path.insert(0, SCRIPTS_DIR)
+    import print_tables
+    import merge_benchmarks
+    merged = os.path.join(work, "merged")
+
+    if stage == "filter_rom_report":
+        with open(os.path.join(work, "rom_report.txt")) as f:
+            sys.stdin = io.StringIO(f.read())
+        sys.stdout = io.StringIO()
+        start = time.perf_counter()
+        runpy.run_path(os.path.join(SCRIPTS_DIR, "filter_rom_report.py"), run_name="__main__")
+        return time.perf_counter() - start
+    if stage == "merge":
+        # --full, repeats would only find merged testcases otherwise
+        sys.argv = ["merge_benchmarks.py", os.path.join(work, "tree"), merged, "--full"]
+        start = time.perf_counter()
+        merge_benchmarks.main()
+        return time.perf_counter() - start
+    if stage == "get_benchmarks":
+        start = time.perf_counter()
+        print_tables.get_benchmarks(merged, pqtls, use_cache=False)
+        return time.perf_counter() - start
+    if stage == "get_benchmarks_cached":
+        # Warms the cache first
+        print_tables.get_benchmarks(merged, pqtls)
+        start = time.perf_counter()
+        print_tables.get_benchmarks(merged, pqtls)
+        return time.perf_counter() - start
+
+    benchmarks = print_tables.get_benchmarks(merged, pqtls, use_cache=False)
+    if stage == "build_average":
+        start = time.perf_counter()
+        print_tables.build_average(benchmarks)
+        return time.perf_counter() - start
+    if stage == "calc_additional_columns":
+        avg = print_tables.build_average(benchmarks)
+        start = time.perf_counter()
+        print_tables.calc_additional_columns(avg, pqtls)
+        return time.perf_counter() - start
+    raise ValueError(f"Unknown stage {stage}.")
+
+
+def measure(stage, work, pqtls):
+    """Runs the stage in a child process, returns (seconds, peak RSS in KiB)."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--stage", stage, "--work", work] + (["--pqtls"] if pqtls else [])
+    env = dict(os.environ, XDG_CACHE_HOME=os.path.join(work, "cache"))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env)
+    out = proc.stdout.read()
+    proc.stdout.close()
+    # wait4 gives the resource usage of exactly this child
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Stage {stage} failed with exit code {proc.returncode}.")
+    return float(out), usage.ru_maxrss
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regressions(result, previous, threshold):
+    """[(stage, previous seconds, seconds)] of stages more than threshold percent slower."""
+    slower = []
+    for stage, res in result["stages"].items():
+        before = previous["stages"].get(stage)
+        if before and res["seconds"] > before["seconds"] * (1 + threshold / 100):
+            slower.append((stage, before["seconds"], res["seconds"]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the host analysis tooling on synthetic benchmark trees.")
+    parser.add_argument("--pqtls", action="store_true", help="Use the PQTLS naming scheme")
+    parser.add_argument("--combinations", type=int, default=27)
+    parser.add_argument("--iterations", type=int, default=50, help="Runs per combination and profile")
+    parser.add_argument("--profiles", type=int, default=3)
+    parser.add_argument("--metrics", type=int, default=30, help="Lines per run file, padded with extra metrics")
+    parser.add_argument("--rom-lines", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage, the fastest counts")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma separated stages")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="JSON lines file results are appended to")
+    parser.add_argument("--compare", action="store_true", help="Fail if a stage got slower than the last result with the same configuration")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown in percent")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated tree")
+    # Internal, a single stage in a child process
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    parser.add_argument("--work", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        # Stage output must not mix with the measurement
+        real_stdout = sys.stdout
+        seconds = run_stage(args.stage, args.work, args.pqtls)
+        print(seconds, file=real_stdout)
+        return
+
+    stages = args.stages.split(",")
+    for stage in stages:
+        if stage not in STAGES:
+            log(f"Unknown stage {stage}. Use some of {', '.join(STAGES)}.")
+            sys.exit(1)
+    if args.profiles < len(PROFILES) and "calc_additional_columns" in stages:
+        log(f"calc_additional_columns needs at least {len(PROFILES)} profiles.")
+        sys.exit(1)
+
+    config = {
+        "protocol": "pqtls" if args.pqtls else "kemtls",
+        "combinations": args.combinations,
+        "iterations": args.iterations,
+        "profiles": args.profiles,
+        "metrics": args.metrics,
+        "rom_lines": args.rom_lines,
+        "repeat": args.repeat,
+    }
+
+    work = tempfile.mkdtemp(prefix="bench_tooling_")
+    try:
+        try:
+            files, records = generate_tree(os.path.join(work, "tree"), args.pqtls, args.combinations,
+                                           args.iterations, args.profiles, args.metrics)
+        except ValueError as e:
+            log(e)
+            sys.exit(1)
+        generate_rom_report(os.path.join(work, "rom_report.txt"), args.rom_lines)
+        merged_files = files // args.profiles
+        log(f"Generated {files} files with {records} records in {work}")
+
+        sizes = {
+            "filter_rom_report": (1, args.rom_lines + 1),
+        }
+        # All stages but filter_rom_report read the merged directory
+        run = set(stages)
+        if run - {"filter_rom_report"}:
+            run.add("merge")
+
+        stage_results = {}
+        rows = []
+        for stage in sorted(run, key=STAGES.index):
+            measurements = [measure(stage, work, args.pqtls) for _ in range(args.repeat)]
+            seconds = min(m[0] for m in measurements)
+            rss = max(m[1] for m in measurements)
+            if stage == "merge":
+                # Merging drops the duplicates of metrics that are not per profile,
+                # the merge and all stages after it are measured by the merged records
+                sizes["merged"] = (merged_files, count_records(os.path.join(work, "merged")))
+            n_files, n_records = sizes[stage if stage in sizes else "merged"]
+            if stage not in stages:
+                continue
+            stage_results[stage] = {
+                "seconds": seconds,
+                "files_per_s": n_files / seconds if seconds else None,
+                "records_per_s": n_records / seconds if seconds else None,
+                "peak_rss_kb": rss,
+            }
+            rows.append([stage, round(seconds, 4), round(n_files / seconds) if seconds else "",
+                         round(n_records / seconds) if seconds else "", rss])
+    finally:
+        if args.keep:
+            log(f"Kept {work}")
+        else:
+            shutil.rmtree(work)
+
+    try:
+        from tabulate import tabulate
+    except ImportError:
+        print("tabulate is not installed. Please do a `pip install tabulate`.")
+        sys.exit(1)
+    print(tabulate(rows, ["Stage", "Seconds", "Files/s", "Records/s", "Peak RSS KiB"], tablefmt="pretty"))
+
+    result = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "config": config,
+        "stages": stage_results,
+    }
+    previous = [r for r in load_results(args.results) if r["config"] == config]
+    with open(args.results, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+    if args.compare:
+        if not previous:
+            log("No earlier result with the same configuration to compare to.")
+            return
+        slower = regressions(result, previous[-1], args.threshold)
+        for stage, before, now in slower:
+            log(f"Regression in {stage}: {before:.4f}s -> {now:.4f}s (revision {previous[-1]['revision']})")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Single file archive of benchmark runs, replacing one .txt file per run.
+
+Layout (little endian, columns 8 byte aligned):
+
+    header      magic "KTBA", u16 version, u16 reserved,
+                u32 runs, u32 metrics, u32 strings
+    strings     per string: u16 length, UTF-8 bytes
+    metrics     per metric: u32 name (string index), u8 column type
+    padding     to 8 bytes
+    profile     u32 string index per run ("" for merged runs)
+    fname       u32 string index per run
+    columns     one per metric, n_runs fixed width values:
+                int64 (MISSING_INT if missing), float64 (NaN if missing)
+                or u32 string index (MISSING_STR if missing)
+
+Readers mmap the file and only touch the columns they need.
+
+Use:
+    benchmark_archive.py import DIR ARCHIVE   (merged DIR or DIR with profile subdirs)
+    benchmark_archive.py export ARCHIVE DIR
+    benchmark_archive.py info ARCHIVE
+"""
+import os
+import re
+import sys
+import mmap
+import math
+import struct
+from pathlib import Path
+
+from benchmark_cache import atomic_write
+
+MAGIC = b"KTBA"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIII")
+METRIC_ENTRY = struct.Struct("<IB")
+
+TYPE_INT = 0
+TYPE_FLOAT = 1
+TYPE_STR = 2
+
+TYPE_CODES = {
+    TYPE_INT: "q",
+    TYPE_FLOAT: "d",
+    TYPE_STR: "I",
+}
+
+MISSING_INT = -2**63
+MISSING_STR = 2**32 - 1
+
+INT_RE = re.compile(r"^-?[0-9]+$")
+FLOAT_RE = re.compile(r"^-?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?$")
+# Hashes that may look like numbers
+STRING_METRICS = {"calibration_key"}
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def parse_value(val, name=None):
+    """
+    Value of a benchmark line as int, float or str (e.g. CMD_finish_success).
+    The one conversion of text files, archives and merged files.
+    """
+    if name in STRING_METRICS:
+        return val
+    # Most values are counters, skip the patterns for them
+    if val.isascii() and val.isdigit():
+        return int(val)
+    if INT_RE.match(val):
+        return int(val)
+    if FLOAT_RE.match(val):
+        return float(val)
+    return val
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def is_archive(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_archive(path, runs):
+    """Writes runs, an iterable of (profile, fname, {metric: value}), to path."""
+    runs = list(runs)
+    strings = {}
+
+    def string_id(s):
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    # Column type is the most general type seen: int < float < str
+    metric_types = {}
+    for _, _, benchmarks in runs:
+        for name, val in benchmarks.items():
+            t = TYPE_STR if isinstance(val, str) else TYPE_FLOAT if isinstance(val, float) else TYPE_INT
+            metric_types[name] = max(t, metric_types.get(name, TYPE_INT))
+    metrics = list(metric_types)
+
+    profiles = [string_id(profile) for profile, _, _ in runs]
+    fnames = [string_id(fname) for _, fname, _ in runs]
+    metric_names = [string_id(name) for name in metrics]
+
+    columns = []
+    for name in metrics:
+        t = metric_types[name]
+        if t == TYPE_INT:
+            col = [b.get(name, MISSING_INT) for _, _, b in runs]
+        elif t == TYPE_FLOAT:
+            col = [float(b.get(name, math.nan)) for _, _, b in runs]
+        else:
+            col = [string_id(str(b[name])) if name in b else MISSING_STR for _, _, b in runs]
+        columns.append(struct.pack(f"<{len(runs)}{TYPE_CODES[t]}", *col))
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(runs), len(metrics), len(strings)))
+    for s in strings:
+        encoded = s.encode()
+        out += struct.pack("<H", len(encoded)) + encoded
+    for name_id, name in zip(metric_names, metrics):
+        out += METRIC_ENTRY.pack(name_id, metric_types[name])
+
+    for col in [struct.pack(f"<{len(runs)}I", *profiles), struct.pack(f"<{len(runs)}I", *fnames)] + columns:
+        out += b"\0" * (_align(len(out)) - len(out))
+        out += col
+
+    atomic_write(path, bytes(out))
+
+
+class BenchmarkArchive:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, self.n_runs, n_metrics, n_strings = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a benchmark archive.")
+        if version != VERSION:
+            raise ValueError(f"Archive {path} has unsupported version {version}.")
+
+        offset = HEADER.size
+        self.strings = []
+        for _ in range(n_strings):
+            length, = struct.unpack_from("<H", self.mm, offset)
+            self.strings.append(self.mm[offset + 2:offset + 2 + length].decode())
+            offset += 2 + length
+
+        entries = [METRIC_ENTRY.unpack_from(self.mm, offset + i * METRIC_ENTRY.size) for i in range(n_metrics)]
+        offset += n_metrics * METRIC_ENTRY.size
+
+        offset = _align(offset)
+        self.profiles = [self.strings[i] for i in self._view(offset, TYPE_STR)]
+        offset = _align(offset + 4 * self.n_runs)
+        self.fnames = [self.strings[i] for i in self._view(offset, TYPE_STR)]
+        offset = _align(offset + 4 * self.n_runs)
+
+        self.metrics = []
+        self._columns = {}
+        for name_id, t in entries:
+            name = self.strings[name_id]
+            self.metrics.append(name)
+            self._columns[name] = (offset, t)
+            offset = _align(offset + struct.calcsize(TYPE_CODES[t]) * self.n_runs)
+
+    def _view(self, offset, t):
+        size = struct.calcsize(TYPE_CODES[t]) * self.n_runs
+        return memoryview(self.mm)[offset:offset + size].cast(TYPE_CODES[t])
+
+    def column(self, name):
+        """
+        Values of one metric for all runs as memoryview of the mapped file:
+        int64 (MISSING_INT where missing), float64 (NaN) or string indices
+        (MISSING_STR), see column_type and value.
+        """
+        offset, t = self._columns[name]
+        return self._view(offset, t)
+
+    def column_type(self, name):
+        return self._columns[name][1]
+
+    def value(self, t, v):
+        """Python value of the column entry v of type t, None if missing."""
+        if t == TYPE_INT:
+            return None if v == MISSING_INT else v
+        if t == TYPE_FLOAT:
+            return None if math.isnan(v) else v
+        return None if v == MISSING_STR else self.strings[v]
+
+    def runs(self, metrics=None):
+        """Yields (profile, fname, {metric: value}) for every run."""
+        names = self.metrics if metrics is None else [m for m in self.metrics if m in metrics]
+        columns = [(name, self.column_type(name), self.column(name)) for name in names]
+        for i in range(self.n_runs):
+            run = {}
+            for name, t, col in columns:
+                val = self.value(t, col[i])
+                if val is not None:
+                    run[name] = val
+            yield self.profiles[i], self.fnames[i], run
+
+
+def read_text_dir(path):
+    """Yields runs of a merged directory and of its profile subdirectories."""
+    for entry in sorted(Path(path).iterdir()):
+        subdir_files = sorted(entry.iterdir()) if entry.is_dir() else [entry]
+        profile = entry.name if entry.is_dir() else ""
+        for file in subdir_files:
+            if not file.name.endswith(".txt"):
+                continue
+            benchmarks = {}
+            with open(file) as f:
+                for line in f:
+                    name, sep, val = line.strip().partition(",")
+                    if not sep:
+                        continue
+                    benchmarks[name] = parse_value(val, name)
+            yield profile, file.name, benchmarks
+
+
+def write_text_dir(archive, path):
+    for profile, fname, benchmarks in archive.runs():
+        out_dir = Path(path) / profile
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with open(out_dir / fname, "w") as f:
+            for name, val in benchmarks.items():
+                f.write(f"{name},{val}\n")
+
+
+def main():
+    try:
+        cmd = sys.argv[1]
+        args = sys.argv[2:]
+        if cmd in ("import", "export"):
+            src, dst = args[0], args[1]
+        elif cmd == "info":
+            src = args[0]
+        else:
+            raise IndexError()
+    except IndexError:
+        print(f"Use: {sys.argv[0]} import DIR ARCHIVE | export ARCHIVE DIR | info ARCHIVE")
+        sys.exit(1)
+
+    if cmd == "import":
+        write_archive(dst, read_text_dir(src))
+        log(f"Wrote {dst}")
+    elif cmd == "export":
+        write_text_dir(BenchmarkArchive(src), dst)
+    else:
+        archive = BenchmarkArchive(src)
+        profiles = sorted(set(archive.profiles))
+        print(f"{archive.n_runs} runs, {len(archive.metrics)} metrics, profiles: {profiles}")
+        for name in archive.metrics:
+            print(f"  {name}")
+
+
+if __name__ == '__main__':
+    main()
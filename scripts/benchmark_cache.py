@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of parsed benchmark files.
+
+Entries are keyed by file name, mtime and size, so only new or changed
+files have to be parsed again. Caches live in the user's cache directory,
+one file per benchmark directory, never inside the benchmark directory.
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "kemtls-experiments")
+# Bump whenever the parsed representation changes
+CACHE_VERSION = 2
+
+
+def atomic_write(path, data, mode="wb"):
+    """
+    Writes data to a temporary file next to path and moves it over path.
+    The permissions of an existing path are kept.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+    umask = os.umask(0)
+    os.umask(umask)
+    try:
+        permissions = os.stat(path).st_mode & 0o7777
+    except OSError:
+        permissions = 0o666 & ~umask
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        # mkstemp creates the file as 0600
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ParseCache:
+    def __init__(self, directory, namespace="parse"):
+        key = hashlib.sha256(os.path.realpath(directory).encode()).hexdigest()[:16]
+        self.path = os.path.join(CACHE_DIR, f"{namespace}_{key}.pickle")
+        self.entries = {}
+        self.dirty = False
+
+        try:
+            with open(self.path, "rb") as f:
+                version, entries = pickle.load(f)
+            if version == CACHE_VERSION:
+                self.entries = entries
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+
+    def get(self, fname, stat):
+        entry = self.entries.get(fname)
+        if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return None
+        return entry[2]
+
+    def put(self, fname, stat, value):
+        self.entries[fname] = (stat.st_mtime_ns, stat.st_size, value)
+        self.dirty = True
+
+    def prune(self, fnames):
+        """Drops entries of files that are gone."""
+        stale = self.entries.keys() - set(fnames)
+        for fname in stale:
+            del self.entries[fname]
+        self.dirty |= bool(stale)
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        atomic_write(self.path, pickle.dumps((CACHE_VERSION, self.entries), pickle.HIGHEST_PROTOCOL))
+        self.dirty = False
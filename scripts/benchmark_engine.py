@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Column oriented aggregation of benchmark runs.
+
+All runs are loaded into one float array of shape
+(combination, run, metric), missing values are NaN. Every statistic is
+then computed for all combinations and metrics in a single vectorized pass.
+"""
+import sys
+import re
+import warnings
+from fnmatch import fnmatch
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy is not installed. Please do a `pip install numpy`.")
+    sys.exit(1)
+
+
+PERCENTILE_RE = r"^p([0-9]+(\.[0-9]+)?)$"
+TRIMMED_RE = r"^trimmed([0-9]+)?$"
+DEFAULT_TRIM_PERCENT = 10
+
+# Scales the MAD to the standard deviation of normal data
+MAD_SCALE = 1.4826
+
+OUTLIER_METHODS = {
+    "mad": 3.5,
+    "iqr": 1.5,
+}
+DEFAULT_OUTLIER_METRICS = ["cycles_*"]
+
+
+def _mad(v):
+    med = np.nanmedian(v, axis=1, keepdims=True)
+    return MAD_SCALE * np.nanmedian(np.abs(v - med), axis=1)
+
+
+def _trimmed_mean(v, percent):
+    """Mean without the lowest and highest percent of each slice."""
+    n = np.sum(~np.isnan(v), axis=1, keepdims=True)
+    cut = np.floor(n * percent / 100)
+    # NaNs are sorted to the end, so ranks < n are the actual values
+    ranks = np.arange(v.shape[1]).reshape(1, -1, 1)
+    keep = (ranks >= cut) & (ranks < n - cut)
+    s = np.sort(v, axis=1)
+    return np.sum(np.where(keep, s, 0.), axis=1) / np.sum(keep, axis=1)
+
+
+STATISTICS = {
+    "mean": lambda v: np.nanmean(v, axis=1),
+    "median": lambda v: np.nanmedian(v, axis=1),
+    "std": lambda v: np.nanstd(v, axis=1, ddof=1),
+    "min": lambda v: np.nanmin(v, axis=1),
+    "max": lambda v: np.nanmax(v, axis=1),
+    "n": lambda v: np.sum(~np.isnan(v), axis=1).astype(float),
+    "mad": _mad,
+}
+
+
+def is_statistic(name):
+    return name in STATISTICS or any(re.match(r, name) for r in (PERCENTILE_RE, TRIMMED_RE))
+
+
+# Statistics of the typical value. Only of those, sums and ratios of the
+# aggregated metrics (the derived columns of print_tables.py) are meaningful.
+LOCATION_STATISTICS = ["mean", "median"]
+
+
+def is_location_statistic(name):
+    return name in LOCATION_STATISTICS or any(re.match(r, name) for r in (PERCENTILE_RE, TRIMMED_RE))
+
+
+def parse_outlier_method(spec):
+    """'mad', 'mad:3' or 'iqr:2' -> (method, threshold)"""
+    method, _, threshold = spec.partition(":")
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"Unknown outlier method {method}. Use one of {', '.join(OUTLIER_METHODS)}.")
+    return method, float(threshold) if threshold else OUTLIER_METHODS[method]
+
+
+class BenchmarkFrame:
+    def __init__(self, combinations, metrics, values):
+        self.combinations = combinations
+        self.metrics = metrics
+        self.values = values
+        self._cache = {}
+
+    @classmethod
+    def from_collected(cls, benchmarks):
+        """
+        Builds the frame from the output of print_tables.get_benchmarks.
+        Metrics with non-numeric values (e.g. CMD_*) are left out.
+        """
+        combinations = sorted(benchmarks.keys())
+        # Keep the order in which metrics appear, tables list them that way
+        metrics = list(dict.fromkeys(
+            name for comb in benchmarks for name, vals in benchmarks[comb].items()
+            if all(isinstance(v, (int, float)) for v in vals)
+        ))
+        metric_idx = {name: i for i, name in enumerate(metrics)}
+        max_runs = max((len(vals) for comb in combinations for vals in benchmarks[comb].values()), default=0)
+
+        values = np.full((len(combinations), max_runs, len(metrics)), np.nan)
+        for c, comb in enumerate(combinations):
+            for name, vals in benchmarks[comb].items():
+                if name in metric_idx:
+                    values[c, :len(vals), metric_idx[name]] = vals
+
+        return cls(combinations, metrics, values)
+
+    def stat(self, name):
+        """Returns the statistic as array of shape (combination, metric)."""
+        if name not in self._cache:
+            with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+                # All-NaN slices are metrics a combination does not have
+                warnings.simplefilter("ignore", RuntimeWarning)
+                if name in STATISTICS:
+                    res = STATISTICS[name](self.values)
+                elif re.match(TRIMMED_RE, name):
+                    percent = re.match(TRIMMED_RE, name).group(1)
+                    res = _trimmed_mean(self.values, float(percent) if percent else DEFAULT_TRIM_PERCENT)
+                else:
+                    m = re.match(PERCENTILE_RE, name)
+                    if m is None:
+                        raise ValueError(f"Unknown statistic {name}. Use one of {', '.join(STATISTICS)}, trimmedNN or pNN.")
+                    res = np.nanpercentile(self.values, float(m.group(1)), axis=1)
+            self._cache[name] = res
+        return self._cache[name]
+
+    def reject_outliers(self, method="mad", threshold=None, patterns=DEFAULT_OUTLIER_METRICS):
+        """
+        Sets outliers of all metrics matching one of the fnmatch patterns to
+        NaN, separately for every combination:
+          mad: more than threshold scaled MADs away from the median
+          iqr: more than threshold IQRs below the 1st or above the 3rd quartile
+        Returns a report {combination: {"metrics": {metric: (dropped values,
+        values)}, "reason": str}}. Values of a metric are not aligned by run
+        (see from_collected), so outliers are only counted per metric.
+        """
+        if threshold is None:
+            threshold = OUTLIER_METHODS[method]
+        selected = [m for m, name in enumerate(self.metrics) if any(fnmatch(name, p) for p in patterns)]
+        v = self.values[:, :, selected]
+
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if method == "mad":
+                med = np.nanmedian(v, axis=1, keepdims=True)
+                mad = _mad(v)[:, None, :]
+                # A MAD of 0 means most values are identical, keep everything then
+                outliers = (mad > 0) & (np.abs(v - med) > threshold * mad)
+                reason = f"more than {threshold} MAD from the median"
+            elif method == "iqr":
+                q1, q3 = np.nanpercentile(v, [25, 75], axis=1, keepdims=True)
+                iqr = q3 - q1
+                outliers = (v < q1 - threshold * iqr) | (v > q3 + threshold * iqr)
+                reason = f"more than {threshold} IQR outside the quartiles"
+            else:
+                raise ValueError(f"Unknown outlier method {method}.")
+
+        counts = np.sum(~np.isnan(v), axis=1)
+        v[outliers] = np.nan
+        self.values[:, :, selected] = v
+        self._cache = {}
+
+        per_metric = outliers.sum(axis=1)
+        return {
+            comb: {
+                "metrics": {
+                    self.metrics[m]: (int(per_metric[c, i]), int(counts[c, i]))
+                    for i, m in enumerate(selected) if counts[c, i]
+                },
+                "reason": reason,
+            } for c, comb in enumerate(self.combinations)
+        }
+
+    def to_dict(self, name):
+        """Returns {combination: {metric: value}}, missing values are left out."""
+        res = self.stat(name)
+        return {
+            comb: {
+                metric: float(res[c, m]) for m, metric in enumerate(self.metrics) if not np.isnan(res[c, m])
+            } for c, comb in enumerate(self.combinations)
+        }
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compact binary framing for benchmark results sent by the board.
+
+Instead of `[benchmark] name: value` text lines, the board can send
+length-prefixed, CRC-checked records with numeric metric IDs:
+
+    SYNC   2 bytes  0xA5 0x5A
+    LEN    1 byte   length of KIND + ID + VALUE
+    KIND   1 byte   KIND_BENCHMARK, KIND_CMD or KIND_ERROR
+    ID     2 bytes  metric/command ID, little endian
+    VALUE  LEN-3    benchmarks: unsigned little endian integer
+                    commands/errors: ASCII string
+    CRC    2 bytes  CRC-16/CCITT (init 0xFFFF) over LEN..VALUE, little endian
+
+Text lines and frames can be mixed on the same link, the receiver detects
+frames by their sync bytes. Calling this script prints the ID table as a C
+header for the firmware.
+"""
+import struct
+import binascii
+
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_HEADER_LEN = len(FRAME_SYNC) + 1
+FRAME_CRC_LEN = 2
+FRAME_MIN_PAYLOAD = 3
+
+KIND_BENCHMARK = 0
+KIND_CMD = 1
+KIND_ERROR = 2
+
+# IDs are part of the wire format, only ever append to these tables.
+METRIC_IDS = {
+    "peak_mem": 1,
+    "bytes_send": 2,
+    "bytes_received": 3,
+    "cycles_wc_pq_make_keypair": 4,
+    "cycles_wc_pq_kem_dec": 5,
+    "cycles_wc_pq_verify_hash": 6,
+    "cycles_wc_pq_kem_encapsulate": 7,
+    "cycles_wc_pq_verify_hash_0": 8,
+    "cycles_wc_pq_verify_hash_1": 9,
+    "cycles_connect": 10,
+    "ticks_connect": 11,
+    "cycles_send": 12,
+    "ticks_send": 13,
+    "cycles_recv": 14,
+    "ticks_recv": 15,
+}
+
+COMMAND_IDS = {
+    "finish_success": 1,
+    "error": 2,
+}
+
+METRIC_NAMES = {v: k for k, v in METRIC_IDS.items()}
+COMMAND_NAMES = {v: k for k, v in COMMAND_IDS.items()}
+
+
+class FrameError(ValueError):
+    pass
+
+
+def _crc(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(kind, name, value):
+    if kind == KIND_BENCHMARK:
+        ident = METRIC_IDS[name]
+        value = int(value)
+        value_bytes = value.to_bytes(max(1, (value.bit_length() + 7) // 8), "little")
+    else:
+        ident = COMMAND_IDS[name] if kind == KIND_CMD else 0
+        value_bytes = str(value).encode()
+
+    body = struct.pack("<BH", kind, ident) + value_bytes
+    if len(body) > 0xFF:
+        raise FrameError(f"Value of {name} too long for one frame.")
+
+    checked = bytes([len(body)]) + body
+    return FRAME_SYNC + checked + struct.pack("<H", _crc(checked))
+
+
+def decode_frame(buffer):
+    """
+    Decodes the frame at the start of buffer.
+    Returns ((kind, name, value), consumed_bytes), or None if the frame is
+    not complete yet. Raises FrameError on corrupt frames.
+    """
+    if len(buffer) < FRAME_HEADER_LEN:
+        return None
+
+    length = buffer[len(FRAME_SYNC)]
+    end = FRAME_HEADER_LEN + length + FRAME_CRC_LEN
+    if len(buffer) < end:
+        return None
+    if length < FRAME_MIN_PAYLOAD:
+        raise FrameError(f"Frame too short ({length} bytes).")
+
+    checked = buffer[len(FRAME_SYNC):end - FRAME_CRC_LEN]
+    crc, = struct.unpack_from("<H", buffer, end - FRAME_CRC_LEN)
+    if crc != _crc(checked):
+        raise FrameError("CRC mismatch.")
+
+    kind, ident = struct.unpack_from("<BH", checked, 1)
+    value_bytes = checked[1 + FRAME_MIN_PAYLOAD:]
+
+    if kind == KIND_BENCHMARK:
+        name = METRIC_NAMES.get(ident, f"metric_{ident}")
+        value = str(int.from_bytes(value_bytes, "little"))
+    elif kind == KIND_CMD:
+        name = COMMAND_NAMES.get(ident, f"cmd_{ident}")
+        value = value_bytes.decode(errors="replace")
+    elif kind == KIND_ERROR:
+        name = f"error_{ident}"
+        value = value_bytes.decode(errors="replace")
+    else:
+        raise FrameError(f"Unknown frame kind {kind}.")
+
+    return (kind, name, value), end
+
+
+def c_header():
+    lines = [
+        "#ifndef BENCHMARK_FRAMES_H",
+        "#define BENCHMARK_FRAMES_H",
+        "",
+        f"#define BENCHMARK_FRAME_SYNC_0 0x{FRAME_SYNC[0]:02x}",
+        f"#define BENCHMARK_FRAME_SYNC_1 0x{FRAME_SYNC[1]:02x}",
+        f"#define BENCHMARK_KIND_BENCHMARK {KIND_BENCHMARK}",
+        f"#define BENCHMARK_KIND_CMD {KIND_CMD}",
+        f"#define BENCHMARK_KIND_ERROR {KIND_ERROR}",
+        "",
+    ]
+    lines += [f"#define BENCHMARK_ID_{name} {ident}" for name, ident in METRIC_IDS.items()]
+    lines += [""]
+    lines += [f"#define BENCHMARK_CMD_ID_{name} {ident}" for name, ident in COMMAND_IDS.items()]
+    lines += ["", "#endif //BENCHMARK_FRAMES_H"]
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    print(c_header())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Emits binary data (certificates, keys) for the wolfssl build.
+
+As C array, the hex text is encoded with a lookup table of the 256 byte
+strings and produced line by line, instead of formatting every byte and
+wrapping the whole string with textwrap, which takes seconds for the
+megabyte of text of a Rainbow certificate. The lines are the same as
+before (13 bytes, at most 80 characters).
+
+With .incbin, the data is stored as binary file and an assembly snippet
+defines the symbol in its own read-only section (.rodata.NAME), so the
+compiler does not parse the data at all. The snippet is a .S file or,
+with incbin_c, top-level asm of a header. It contains the hash of the
+data, so the including file changes (and is recompiled) with the blob.
+
+Use:
+    c_array_emitter.py FILE NAME [--size BYTES] [--incbin BLOB_PATH]
+"""
+import io
+import sys
+import hashlib
+import argparse
+
+from benchmark_cache import atomic_write
+
+HEX_BYTES = ["0x%02x" % b for b in range(256)]
+BYTES_PER_LINE = 13
+
+
+def hex_lines(data, per_line=BYTES_PER_LINE):
+    """Lines of "0x.., 0x.." of data, without the separating comma."""
+    lookup = HEX_BYTES.__getitem__
+    for start in range(0, len(data), per_line):
+        yield ", ".join(map(lookup, data[start:start + per_line]))
+
+
+def write_c_array(f, name, data, size=None, type="const char"):
+    """Writes the definition of the array name with data to f, size defaults to the data length."""
+    f.write(f"{type} {name}[{size or len(data)}] = {{\n")
+    separator = ""
+    for line in hex_lines(data):
+        f.write(separator)
+        f.write(line)
+        separator = ",\n"
+    f.write("\n};")
+
+
+def c_array(name, data, size=None, type="const char"):
+    out = io.StringIO()
+    write_c_array(out, name, data, size, type)
+    return out.getvalue()
+
+
+def incbin_asm(name, blob_path, data, size=None):
+    """Assembly lines that define name with the contents of blob_path (data), zero padded to size."""
+    lines = [
+        f"/* {name}: {len(data)} bytes, sha256 {hashlib.sha256(data).hexdigest()} */",
+        f'.pushsection .rodata.{name}, "a"',
+        f".global {name}",
+        f".type {name}, %object",
+        f"{name}:",
+        f'.incbin "{blob_path}"',
+    ]
+    if size and size > len(data):
+        lines.append(f".zero {size - len(data)}")
+    lines += [f".size {name}, . - {name}", ".popsection"]
+    return lines
+
+
+def incbin_c(name, blob_path, data, size=None, type="const char"):
+    """Top-level asm that defines name from blob_path plus its C declaration."""
+    quoted = (line.replace("\\", "\\\\").replace('"', '\\"') for line in incbin_asm(name, blob_path, data, size))
+    asm = "".join(f'    "{line}\\n"\n' for line in quoted)
+    return f"__asm__(\n{asm});\nextern {type} {name}[{size or len(data)}];"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emits a file as C array or as .incbin assembly.")
+    parser.add_argument("file")
+    parser.add_argument("name", help="Symbol name")
+    parser.add_argument("--size", type=int, help="Array size, if larger than the file")
+    parser.add_argument("--incbin", metavar="BLOB_PATH", help="Copy the file to BLOB_PATH and print assembly that includes it")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as f:
+        data = f.read()
+    if args.size and args.size < len(data):
+        print(f"{args.file} has {len(data)} bytes, more than --size {args.size}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.incbin:
+        atomic_write(args.incbin, data)
+        print("\n".join(incbin_asm(args.name, args.incbin, data, args.size)))
+    else:
+        write_c_array(sys.stdout, args.name, data, args.size)
+        print()
+
+
+if __name__ == '__main__':
+    main()
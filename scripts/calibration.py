@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Calibration of the baselines print_tables.py needs, measured from
+reference builds instead of copied by hand:
+
+    text_base_size              .text (Berkeley text) of the build without PQC
+    rom_size_wolfssl_wo_pqm4    rom_size_wolfssl - rom_size_PQM4 - rom_size_ca_cert
+                                of the reference build (elf_sizes.py output)
+    stack                       per scheme worst-case stack depths along the call
+                                graph of -fstack-usage -fcallgraph-info=su
+                                (see stack_analysis.py)
+
+Calibrations are cached in the user's cache directory, keyed by a hash of
+the compiler identification in the ELF's .comment section and the given
+configuration files (e.g. build/zephyr/.config). run_experiments.sh writes
+the key of every build into the benchmark files as calibration_key, so
+print_tables.py picks the matching calibration up automatically.
+
+The run scripts only record the key, measure is run by hand once per
+toolchain. The reference build without PQC has its own configuration and
+thus another key than the campaign builds, so measure stores under the key
+of a campaign build given with --key (calibration.py key of one of its
+ELFs, or the calibration_key of its benchmark files). Runs whose key has
+no calibration use the fixed baselines of print_tables.py, which is logged.
+
+Use:
+    calibration.py key --elf ELF [--config FILE]...
+    calibration.py measure --elf BASE_ELF [--config FILE]... [--key KEY]
+                           [--rom-report FILE] [--stack SCHEME=DIR]... [--force]
+    calibration.py show [KEY]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+from benchmark_cache import CACHE_DIR, atomic_write
+from elf_reader import ElfFile
+
+CALIBRATION_PATH = os.path.join(CACHE_DIR, "calibration.json")
+CALIBRATION_VERSION = 1
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def calibration_key(elf_path, config_paths=()):
+    h = hashlib.sha256()
+    h.update(ElfFile(elf_path).compiler().encode())
+    for path in sorted(config_paths):
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+
+def load_all():
+    try:
+        with open(CALIBRATION_PATH) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get("version") != CALIBRATION_VERSION:
+        return {}
+    return state["calibrations"]
+
+
+def load_calibration(key):
+    """The calibration stored for key, None if there is none."""
+    return load_all().get(key)
+
+
+def store_calibration(key, calibration):
+    calibrations = load_all()
+    calibrations[key] = calibration
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    atomic_write(CALIBRATION_PATH, json.dumps({"version": CALIBRATION_VERSION, "calibrations": calibrations}, indent=1), mode="w")
+
+
+def store_stack(key, stack):
+    """Adds {scheme: {stack figure: bytes}} to calibration key, which is created if needed."""
+    calibration = load_calibration(key) or {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "stack": {}}
+    calibration["stack"].update(stack)
+    store_calibration(key, calibration)
+
+
+def scheme_stack(scheme, directory):
+    """{stack figure: worst-case depth} of scheme from the call graph below directory."""
+    # stack_analysis.py imports this module for store_stack
+    from stack_analysis import read_call_graph, scheme_stacks, with_static_data, STATIC_SCRATCH
+    graph = read_call_graph([directory])
+    if not graph.edges:
+        raise ValueError(f"No call graph in {directory}. Build with -fstack-usage -fcallgraph-info=su.")
+    stacks, problems = scheme_stacks(graph)
+    for kind, name in sorted(problems):
+        log(f"{kind}: {name}")
+    if scheme in STATIC_SCRATCH:
+        raise ValueError(f"The figures of {scheme} include static scratch, use stack_analysis.py --elf.")
+    if scheme not in stacks:
+        raise ValueError(f"No {scheme} entry points in the call graph of {directory}.")
+    return with_static_data(stacks)[scheme]
+
+
+def read_rom_report(path):
+    sizes = {}
+    with open(path) as f:
+        for line in f:
+            name, _, val = line.strip().partition(",")
+            if val:
+                sizes[name] = int(val)
+    return sizes
+
+
+def measure(elf_path, rom_report=None, stacks=()):
+    elf = ElfFile(elf_path)
+    calibration = {
+        "compiler": elf.compiler(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "text_base_size": elf.berkeley_sizes()[0],
+        "stack": {},
+    }
+    if rom_report:
+        sizes = read_rom_report(rom_report)
+        calibration["rom_size_wolfssl_wo_pqm4"] = sizes["rom_size_wolfssl"] - sizes["rom_size_PQM4"] - sizes["rom_size_ca_cert"]
+    for scheme, directory in stacks:
+        calibration["stack"][scheme] = scheme_stack(scheme, directory)
+    return calibration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and cache the baselines of print_tables.py.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    key_parser = sub.add_parser("key", help="Print the calibration key of a build")
+    measure_parser = sub.add_parser("measure", help="Calibrate from a reference build without PQC")
+    for p in (key_parser, measure_parser):
+        p.add_argument("--elf", required=True)
+        p.add_argument("--config", action="append", default=[], help="Configuration file that is part of the key (repeatable)")
+    measure_parser.add_argument("--rom-report", help="elf_sizes.py or filter_rom_report.py output of the reference build")
+    measure_parser.add_argument("--key", help="Store under the key of the campaign builds instead of BASE_ELF's")
+    measure_parser.add_argument("--stack", action="append", default=[], metavar="SCHEME=DIR",
+                                help="Build directory with the .ci and .su files of a scheme (repeatable)")
+    measure_parser.add_argument("--force", action="store_true", help="Measure again even if the key is cached")
+    show_parser = sub.add_parser("show", help="Print cached calibrations")
+    show_parser.add_argument("key", nargs="?")
+    args = parser.parse_args()
+
+    if args.cmd == "show":
+        calibrations = load_all()
+        if args.key:
+            calibrations = {args.key: calibrations[args.key]} if args.key in calibrations else {}
+        print(json.dumps(calibrations, indent=1))
+        return
+
+    key = calibration_key(args.elf, args.config)
+    if args.cmd == "key":
+        print(key)
+        return
+    if args.key:
+        key = args.key
+    else:
+        log(f"Storing under the key {key} of {args.elf}, runs of builds with another configuration will not find it. See --key.")
+
+    cached = load_calibration(key)
+    if cached is not None and "text_base_size" in cached and not args.force:
+        log(f"Calibration {key} is cached.")
+        print(key)
+        return
+    try:
+        stacks = [spec.split("=", 1) for spec in args.stack]
+        if any(len(spec) != 2 for spec in stacks):
+            raise ValueError("Stack directories are given as SCHEME=DIR.")
+        calibration = measure(args.elf, args.rom_report, stacks)
+    except (ValueError, OSError, KeyError) as e:
+        log(f"Calibration failed: {e}")
+        sys.exit(1)
+    if cached is not None:
+        # Keep figures of stack_analysis.py for schemes that were not measured
+        calibration["stack"] = dict(cached.get("stack", {}), **calibration["stack"])
+    store_calibration(key, calibration)
+    log(f"Stored calibration {key}")
+    print(key)
+
+
+if __name__ == '__main__':
+    main()
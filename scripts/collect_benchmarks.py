@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Receive benchmark results from several boards at once.
+
+Every board is given as BOARD_ID=PORT. Each board gets its own output
+file, so one host can drive a whole board farm in parallel:
+
+    scripts/collect_benchmarks.py gg0=/dev/ttyACM0 gg1=/dev/ttyACM1 \
+        --output "benchmarks/kemtls/{board}/kyber512_falcon512_kyber512_1.txt"
+"""
+import sys
+import argparse
+import selectors
+
+from recv_benchmarks import BenchmarkReceiver, EXIT_CODES, open_serial, add_timeout_args, serial
+
+
+class BoardLog:
+    """Prefixes everything a receiver logs with its board ID."""
+    def __init__(self, board_id, log=sys.stderr):
+        self.board_id = board_id
+        self.log = log
+
+    def write(self, msg):
+        if not msg.endswith("\n"):
+            msg += "\n"
+        self.log.write(f"[{self.board_id}] {msg}")
+
+
+class Board:
+    def __init__(self, board_id, port, out_path, **timeouts):
+        self.board_id = board_id
+        self.port = port
+        self.serial = open_serial(port, timeout=0)
+        self.out = open(out_path, "a")
+        self.receiver = BenchmarkReceiver(self.out, BoardLog(board_id), **timeouts)
+
+    def read(self):
+        """Reads whatever is pending, returns False if the port went away."""
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            self.receiver.log.write(f"Lost port {self.port}: {e}")
+            return False
+        self.receiver.feed(data)
+        return True
+
+    def close(self):
+        self.serial.close()
+        self.out.close()
+
+
+def parse_board_spec(spec):
+    board_id, sep, port = spec.partition("=")
+    if not sep or not board_id or not port:
+        raise argparse.ArgumentTypeError(f"Board must be given as BOARD_ID=PORT, got '{spec}'.")
+    return board_id, port
+
+
+def collect(boards, log=sys.stderr):
+    """
+    Watches all boards until each one finished or lost its port.
+    Returns a dict of board ID -> exit code.
+    """
+    sel = selectors.DefaultSelector()
+    for board in boards:
+        sel.register(board.serial.fileno(), selectors.EVENT_READ, board)
+
+    exit_codes = {}
+
+    def finish(key):
+        board = key.data
+        sel.unregister(key.fd)
+        board.close()
+        exit_codes[board.board_id] = board.receiver.exit_code
+        log.write(f"[{board.board_id}] Finished communication.\n")
+
+    while sel.get_map():
+        time_left = [key.data.receiver.time_left() for key in sel.get_map().values()]
+        time_left = [t for t in time_left if t is not None]
+
+        for key, _ in sel.select(min(time_left) if time_left else None):
+            board = key.data
+            alive = board.read()
+            if board.receiver.finished or not alive:
+                finish(key)
+
+        for key in list(sel.get_map().values()):
+            if key.data.receiver.check_timeout():
+                finish(key)
+
+    sel.close()
+    return exit_codes
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Receive benchmark results of several boards in parallel.")
+    parser.add_argument("boards", nargs="+", type=parse_board_spec, metavar="BOARD_ID=PORT")
+    parser.add_argument("--output", default="{board}.txt",
+                        help="Output path per board, '{board}' is replaced by the board ID. Default: '{board}.txt'.")
+    add_timeout_args(parser)
+    args = parser.parse_args(argv)
+
+    ids = [board_id for board_id, _ in args.boards]
+    if len(set(ids)) != len(ids):
+        parser.error("Board IDs must be unique.")
+    if len(ids) > 1 and "{board}" not in args.output:
+        parser.error("--output must contain '{board}' when collecting from more than one board.")
+
+    return args
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+
+    timeouts = dict(read_timeout=args.read_timeout, run_timeout=args.run_timeout)
+    boards = [Board(board_id, port, args.output.format(board=board_id), **timeouts) for board_id, port in args.boards]
+    exit_codes = collect(boards)
+
+    status_names = {EXIT_CODES.SUCCESS: "success", EXIT_CODES.TIMEOUT: "timeout"}
+    for board_id, code in sorted(exit_codes.items()):
+        sys.stderr.write(f"[{board_id}] {status_names.get(code, 'error')}\n")
+
+    codes = set(exit_codes.values())
+    if codes == {EXIT_CODES.SUCCESS}:
+        return EXIT_CODES.SUCCESS
+    if codes <= {EXIT_CODES.SUCCESS, EXIT_CODES.TIMEOUT}:
+        return EXIT_CODES.TIMEOUT
+    return EXIT_CODES.ERROR
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Compares KEMTLS and PQTLS runs with the same key exchange and CA signature.
+
+For every pair of a KEMTLS combination (kex, sig, kem) and a PQTLS
+combination (kex, root=sig, leaf) and every selected metric, the
+difference PQTLS - KEMTLS of the statistic is reported with a bootstrap
+confidence interval, the ratio PQTLS / KEMTLS, Hedges' g and a two-sided
+bootstrap p-value. All resamples of a pair are drawn at once as an index
+array of shape (resamples, runs), so the resampled statistics of all
+metrics are computed in one vectorized pass.
+
+Derived per run metrics:
+    bytes_traffic           bytes_send + bytes_received
+    wolfssl_max_mem_usage   peak_mem + largest PQM4 stack usage
+
+Static values are taken like in print_tables.py: stack figures of the
+calibration the runs were built with (or --calibration KEY) and the
+Rainbow public key size as peak_mem.
+"""
+import sys
+import argparse
+import warnings
+from fnmatch import fnmatch
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy is not installed. Please do a `pip install numpy`.")
+    sys.exit(1)
+
+from print_tables import get_runs, static_benchmarks, resolve_calibration, print_table, log
+
+DEFAULT_METRICS = ["cycles_connect_*", "bytes_traffic", "wolfssl_max_mem_usage"]
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+
+STATISTICS = {
+    "mean": np.nanmean,
+    "median": np.nanmedian,
+}
+
+
+def derive_run_metrics(record, pqtls, stack):
+    """Per run values of the benchmarks and static values plus the derived metrics."""
+    run = {name: val for name, val in record.items() if isinstance(val, (int, float))}
+    static = static_benchmarks(record.combination, pqtls, stack)
+    # Static values replace measured ones, e.g. peak_mem of Rainbow
+    run.update(static)
+    if "bytes_send" in run and "bytes_received" in run:
+        run["bytes_traffic"] = run["bytes_send"] + run["bytes_received"]
+    if "peak_mem" in run:
+        stacks = [val for name, val in static.items() if name.endswith("_stack")]
+        run["wolfssl_max_mem_usage"] = run["peak_mem"] + max(stacks)
+    return run
+
+
+def load(path, pqtls, jobs=None, use_cache=True, calibration=None):
+    """Returns {(kex, sig, third alg): [run]}, third alg is the KEM (KEMTLS) or leaf signature (PQTLS)."""
+    records = get_runs(path, pqtls, jobs, use_cache)
+    _, stack, _ = resolve_calibration((record.get("calibration_key") for record in records), pqtls, calibration)
+    combinations = {}
+    for record in records:
+        combinations.setdefault(record.combination, []).append(derive_run_metrics(record, pqtls, stack))
+    return combinations
+
+
+def select_metrics(combinations, patterns):
+    names = dict.fromkeys(name for runs in combinations.values() for run in runs for name in run)
+    return [name for name in names if any(fnmatch(name, p) for p in patterns)]
+
+
+def to_array(runs, metrics):
+    """(run, metric) array, NaN where a run lacks a metric."""
+    return np.array([[run.get(m, np.nan) for m in metrics] for run in runs], dtype=float)
+
+
+def hedges_g(a, b):
+    """Standardized mean difference of b and a per metric, small sample corrected."""
+    na = np.sum(~np.isnan(a), axis=0)
+    nb = np.sum(~np.isnan(b), axis=0)
+    va = np.nanvar(a, axis=0, ddof=1)
+    vb = np.nanvar(b, axis=0, ddof=1)
+    pooled = np.sqrt(((na - 1) * va + (nb - 1) * vb) / (na + nb - 2))
+    correction = 1 - 3 / (4 * (na + nb) - 9)
+    return (np.nanmean(b, axis=0) - np.nanmean(a, axis=0)) / pooled * correction
+
+
+def bootstrap(a, b, stat, resamples, confidence, rng):
+    """
+    Compares the (run, metric) arrays a and b. Returns a dict of per
+    metric arrays: stat of a and b, difference b - a with confidence
+    interval, ratio b / a, Hedges' g and the bootstrap p-value.
+    """
+    f = STATISTICS[stat]
+    ia = rng.integers(0, len(a), size=(resamples, len(a)))
+    ib = rng.integers(0, len(b), size=(resamples, len(b)))
+    # (resamples, metric)
+    diffs = f(b[ib], axis=1) - f(a[ia], axis=1)
+
+    alpha = (1 - confidence) / 2
+    low, high = np.nanpercentile(diffs, [100 * alpha, 100 * (1 - alpha)], axis=0)
+    # Share of resamples on the other side of 0, at least one resample
+    p = 2 * np.minimum(np.mean(diffs <= 0, axis=0), np.mean(diffs >= 0, axis=0))
+    p = np.clip(p, 1 / resamples, 1)
+
+    sa, sb = f(a, axis=0), f(b, axis=0)
+    return {
+        "kemtls": sa,
+        "pqtls": sb,
+        "diff": sb - sa,
+        "low": low,
+        "high": high,
+        "ratio": sb / sa,
+        "g": hedges_g(a, b),
+        "p": p,
+    }
+
+
+def compare(kemtls, pqtls, metrics, stat="mean", resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=0):
+    """Yields (kemtls combination, pqtls combination, metric, result dict) for all aligned pairs."""
+    rng = np.random.default_rng(seed)
+    for k_comb in sorted(kemtls):
+        a = to_array(kemtls[k_comb], metrics)
+        for p_comb in sorted(pqtls):
+            if p_comb[:2] != k_comb[:2]:
+                continue
+            b = to_array(pqtls[p_comb], metrics)
+            with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+                # Metrics only one protocol has are NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                res = bootstrap(a, b, stat, resamples, confidence, rng)
+            for m, metric in enumerate(metrics):
+                if np.isnan(res["diff"][m]):
+                    continue
+                yield k_comb, p_comb, metric, {name: float(vals[m]) for name, vals in res.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap comparison of KEMTLS and PQTLS benchmarks.")
+    parser.add_argument("kemtls", help="Merged KEMTLS benchmark directory or archive")
+    parser.add_argument("pqtls", help="Merged PQTLS benchmark directory or archive")
+    parser.add_argument("--metrics", default=",".join(DEFAULT_METRICS), help="Comma separated fnmatch patterns")
+    parser.add_argument("--stat", choices=STATISTICS, default="mean")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--calibration", metavar="KEY", help="Calibration of both builds, default: the one the runs were built with")
+    parser.add_argument("--csv", action="store_true")
+    args = parser.parse_args()
+
+    kemtls = load(args.kemtls, False, args.jobs, not args.no_cache, args.calibration)
+    pqtls = load(args.pqtls, True, args.jobs, not args.no_cache, args.calibration)
+    metrics = select_metrics(kemtls, args.metrics.split(","))
+    if not metrics:
+        log(f"No metrics match {args.metrics}.")
+        sys.exit(1)
+
+    field_names = ["KEX", "Sig", "KEMTLS KEM", "PQTLS Leaf", "Metric", "KEMTLS", "PQTLS", "Diff",
+                   f"CI {args.confidence:g} low", "high", "Ratio", "Hedges g", "p"]
+    rows = []
+    for k_comb, p_comb, metric, res in compare(kemtls, pqtls, metrics, args.stat, args.resamples, args.confidence, args.seed):
+        rows.append(list(k_comb) + [p_comb[2], metric] + [
+            round(res[name], 1) for name in ("kemtls", "pqtls", "diff", "low", "high")
+        ] + [
+            round(res["ratio"], 3), round(res["g"], 2), round(res["p"], 4),
+        ])
+    if not rows:
+        log("No KEMTLS and PQTLS combinations share key exchange and CA signature.")
+        sys.exit(1)
+
+    if args.csv:
+        print(",".join(field_names))
+        for row in rows:
+            print(",".join(str(f) for f in row))
+    else:
+        print_table(field_names, rows)
+
+
+if __name__ == '__main__':
+    main()
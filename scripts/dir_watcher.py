@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Reports files that were written in a directory and its direct subdirectories.
+
+Uses inotify where available and falls back to polling mtime and size.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+class DirWatcher:
+    def __init__(self, root, use_inotify=True):
+        self.root = root
+        self.fd = None
+        self.watches = {}
+        self.stats = {}
+
+        libc = _load_libc() if use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self.libc = libc
+                self.fd = fd
+        if self.fd is None:
+            log("inotify not available, polling for changes.")
+
+        self._watch(root)
+        for entry in os.scandir(root):
+            if entry.is_dir():
+                self._watch(entry.path)
+
+    def _watch(self, path):
+        if self.fd is None:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {path}")
+        self.watches[wd] = path
+
+    def _scan(self):
+        files = {}
+        for entry in os.scandir(self.root):
+            entries = os.scandir(entry.path) if entry.is_dir() else [entry]
+            for e in entries:
+                if e.is_file():
+                    st = e.stat()
+                    files[e.path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def existing(self):
+        """All files present right now."""
+        self.stats = self._scan()
+        return sorted(self.stats)
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds, returns the set of written files."""
+        if self.fd is None:
+            time.sleep(timeout)
+            files = self._scan()
+            changed = {path for path, st in files.items() if self.stats.get(path) != st}
+            self.stats = files
+            return changed
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return changed
+            raise
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            path = os.path.join(self.watches.get(wd, self.root), os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & IN_CREATE and self.watches.get(wd) == self.root:
+                    self._watch(path)
+                    changed.update(e.path for e in os.scandir(path) if e.is_file())
+            elif name:
+                changed.add(path)
+        return changed
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Minimal reader for ELF files (32 and 64 bit, both byte orders).
+
+Reads the section headers, section contents and the symbol table, and
+maps addresses to the source file of their compilation unit using the
+DWARF .debug_info and .debug_aranges sections (versions 2 to 5), which is
+all the size and calibration scripts need, so no binutils are required on
+the host.
+"""
+import os
+import struct
+from bisect import bisect_right
+
+ELF_MAGIC = b"\x7fELF"
+
+EM_ARM = 40
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+
+PT_LOAD = 1
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_FILE = 4
+
+DW_TAG_compile_unit = 0x11
+DW_TAG_subprogram = 0x2e
+DW_TAG_variable = 0x34
+DW_TAG_partial_unit = 0x3c
+DW_TAG_skeleton_unit = 0x4a
+
+DW_AT_sibling = 0x01
+DW_AT_location = 0x02
+DW_AT_name = 0x03
+DW_AT_low_pc = 0x11
+DW_AT_comp_dir = 0x1b
+DW_AT_str_offsets_base = 0x72
+DW_AT_addr_base = 0x73
+
+DW_OP_addr = 0x03
+
+DW_FORM_addr = 0x01
+DW_FORM_string = 0x08
+DW_FORM_strp = 0x0e
+DW_FORM_ref_addr = 0x10
+DW_FORM_indirect = 0x16
+DW_FORM_strx = 0x1a
+DW_FORM_addrx = 0x1b
+DW_FORM_line_strp = 0x1f
+DW_FORM_implicit_const = 0x21
+DW_FORM_strx1, DW_FORM_strx4 = 0x25, 0x28
+DW_FORM_addrx1, DW_FORM_addrx4 = 0x29, 0x2c
+
+# Forms of fixed size (DW_FORM_flag_present and DW_FORM_implicit_const have no data)
+FIXED_FORM_SIZES = {
+    0x0b: 1, 0x05: 2, 0x06: 4, 0x07: 8, 0x1e: 16, 0x0c: 1, 0x19: 0, 0x21: 0,
+    0x11: 1, 0x12: 2, 0x13: 4, 0x14: 8, 0x20: 8, 0x1c: 4, 0x24: 8,
+    0x25: 1, 0x26: 2, 0x27: 3, 0x28: 4, 0x29: 1, 0x2a: 2, 0x2b: 3, 0x2c: 4,
+}
+# strp, sec_offset, line_strp, strp_sup
+OFFSET_FORMS = {0x0e, 0x17, 0x1f, 0x1d}
+# udata, ref_udata, strx, addrx, loclistx, rnglistx
+ULEB_FORMS = {0x0f, 0x15, 0x1a, 0x1b, 0x22, 0x23}
+SLEB_FORMS = {0x0d}
+# Length prefixed blocks: block1, block2, block4
+BLOCK_FORMS = {0x0a: 1, 0x03: 2, 0x04: 4}
+# block and exprloc, with uleb length
+ULEB_BLOCK_FORMS = {0x09, 0x18}
+
+
+class Section:
+    __slots__ = ("name", "type", "flags", "addr", "offset", "size", "link", "info", "entsize")
+
+    def __init__(self, name, type, flags, addr, offset, size, link, info, entsize):
+        self.name = name
+        self.type = type
+        self.flags = flags
+        self.addr = addr
+        self.offset = offset
+        self.size = size
+        self.link = link
+        self.info = info
+        self.entsize = entsize
+
+
+class Segment:
+    __slots__ = ("type", "offset", "vaddr", "paddr", "filesz", "memsz")
+
+    def __init__(self, type, offset, vaddr, paddr, filesz, memsz):
+        self.type = type
+        self.offset = offset
+        self.vaddr = vaddr
+        self.paddr = paddr
+        self.filesz = filesz
+        self.memsz = memsz
+
+
+class Symbol:
+    __slots__ = ("name", "value", "size", "type", "bind", "shndx", "file")
+
+    def __init__(self, name, value, size, type, bind, shndx, file):
+        self.name = name
+        self.value = value
+        self.size = size
+        self.type = type
+        self.bind = bind
+        self.shndx = shndx
+        # Source file of local symbols (STT_FILE before them), None for globals
+        self.file = file
+
+
+def _uleb(data, pos):
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _sleb(data, pos):
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        shift += 7
+        if b < 0x80:
+            if b & 0x40:
+                result -= 1 << shift
+            return result, pos
+
+
+class SourceMap:
+    """Source path of the compilation unit of an address."""
+    def __init__(self, addresses, ranges):
+        # {address: path} of functions and variables
+        self.addresses = addresses
+        # Sorted [(start, end, path)] of .debug_aranges
+        self.ranges = ranges
+        self.starts = [start for start, _, _ in ranges]
+
+    def path(self, address):
+        path = self.addresses.get(address)
+        if path is not None:
+            return path
+        i = bisect_right(self.starts, address) - 1
+        if i >= 0 and address < self.ranges[i][1]:
+            return self.ranges[i][2]
+        return None
+
+
+class ElfFile:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        if self.data[:4] != ELF_MAGIC:
+            raise ValueError(f"{path} is not an ELF file.")
+
+        self.is64 = self.data[4] == 2
+        self.endian = "<" if self.data[5] == 1 else ">"
+        if self.is64:
+            header = struct.unpack_from(self.endian + "HHIQQQIHHHHHH", self.data, 16)
+        else:
+            header = struct.unpack_from(self.endian + "HHIIIIIHHHHHH", self.data, 16)
+        _, self.machine, _, self.entry, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum, shstrndx = header
+
+        sh_format = self.endian + ("IIQQQQIIQQ" if self.is64 else "IIIIIIIIII")
+        raw = [struct.unpack_from(sh_format, self.data, shoff + i * shentsize) for i in range(shnum)]
+        names = raw[shstrndx] if shnum else None
+        ph_format = self.endian + ("IIQQQQQQ" if self.is64 else "IIIIIIII")
+        self.segments = []
+        for i in range(phnum):
+            header = struct.unpack_from(ph_format, self.data, phoff + i * phentsize)
+            if self.is64:
+                type, _, offset, vaddr, paddr, filesz, memsz, _ = header
+            else:
+                type, offset, vaddr, paddr, filesz, memsz, _, _ = header
+            self.segments.append(Segment(type, offset, vaddr, paddr, filesz, memsz))
+
+        self.sections = []
+        for name, type, flags, addr, offset, size, link, info, _, entsize in raw:
+            self.sections.append(Section(
+                self._string(names[4], name) if names else "", type, flags, addr, offset, size, link, info, entsize,
+            ))
+
+    def _string(self, offset, index):
+        start = offset + index
+        return self.data[start:self.data.index(b"\0", start)].decode(errors="replace")
+
+    def section(self, name):
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+    def symbol(self, name):
+        """The global symbol name, None if there is none."""
+        for symbol in self.symbols():
+            if symbol.name == name and symbol.bind != 0:
+                return symbol
+        return None
+
+    def file_offset(self, address):
+        """Offset of the initial contents of address in the ELF file, None if it has none."""
+        for section in self.sections:
+            if section.flags & SHF_ALLOC and section.type != SHT_NOBITS and section.addr <= address < section.addr + section.size:
+                return section.offset + address - section.addr
+        return None
+
+    def load_address(self, address):
+        """Address the initial contents of address are loaded from (LMA), e.g. flash for .data."""
+        for segment in self.segments:
+            if segment.type == PT_LOAD and segment.vaddr <= address < segment.vaddr + segment.filesz:
+                return segment.paddr + address - segment.vaddr
+        return address
+
+    def binary_offset(self, address):
+        """
+        Offset of the initial contents of address in the raw binary of
+        objcopy -O binary, which starts at the lowest load address.
+        """
+        start = min(
+            self.load_address(section.addr) for section in self.sections
+            if section.flags & SHF_ALLOC and section.type != SHT_NOBITS and section.size
+        )
+        return self.load_address(address) - start
+
+    def contents(self, section):
+        if section.type == SHT_NOBITS:
+            return b""
+        return self.data[section.offset:section.offset + section.size]
+
+    def berkeley_sizes(self):
+        """(text, data, bss) like `size` prints them, text includes read only data."""
+        text = data = bss = 0
+        for section in self.sections:
+            if not section.flags & SHF_ALLOC:
+                continue
+            if section.type == SHT_NOBITS:
+                bss += section.size
+            elif section.flags & SHF_WRITE:
+                data += section.size
+            else:
+                text += section.size
+        return text, data, bss
+
+    def symbols(self):
+        """Symbols of .symtab, locals with the source file name of their STT_FILE symbol."""
+        symtab = self.section(".symtab")
+        if symtab is None:
+            return []
+        strtab = self.sections[symtab.link]
+        if self.is64:
+            sym_format, fields = self.endian + "IBBHQQ", (0, 4, 5, 1, 2, 3)
+        else:
+            sym_format, fields = self.endian + "IIIBBH", (0, 1, 2, 3, 4, 5)
+        entsize = symtab.entsize or struct.calcsize(sym_format)
+
+        symbols = []
+        file = None
+        for offset in range(symtab.offset + entsize, symtab.offset + symtab.size, entsize):
+            raw = struct.unpack_from(sym_format, self.data, offset)
+            name, value, size, info, _, shndx = (raw[i] for i in fields)
+            type, bind = info & 0xf, info >> 4
+            name = self._string(strtab.offset, name)
+            if type == STT_FILE:
+                file = name
+                continue
+            if type == STT_FUNC and self.machine == EM_ARM:
+                # Thumb functions have the lowest bit set
+                value &= ~1
+            symbols.append(Symbol(name, value, size, type, bind, shndx, file if bind == 0 else None))
+        return symbols
+
+    def source_map(self):
+        """SourceMap of the compilation units in the DWARF debug information."""
+        info = self.section(".debug_info")
+        if info is None:
+            return SourceMap({}, [])
+        info = self.contents(info)
+        abbrev = self._debug_section(".debug_abbrev")
+        strings = self._debug_section(".debug_str")
+        line_strings = self._debug_section(".debug_line_str")
+        str_offsets = self._debug_section(".debug_str_offsets")
+        addr = self._debug_section(".debug_addr")
+        byteorder = "little" if self.endian == "<" else "big"
+
+        def number(pos, size):
+            return int.from_bytes(info[pos:pos + size], byteorder)
+
+        def string(section, offset):
+            return section[offset:section.index(b"\0", offset)].decode(errors="replace")
+
+        abbrev_tables = {}
+        addresses = {}
+        unit_paths = {}
+        pos = 0
+        while pos < len(info):
+            unit_offset = pos
+            unit_length, offset_size = number(pos, 4), 4
+            pos += 4
+            if unit_length == 0xffffffff:
+                unit_length, offset_size = number(pos, 8), 8
+                pos += 8
+            unit_end = pos + unit_length
+            version = number(pos, 2)
+            pos += 2
+            if version >= 5:
+                unit_type, address_size = info[pos], info[pos + 1]
+                abbrev_offset = number(pos + 2, offset_size)
+                pos += 2 + offset_size
+                if unit_type in (4, 5):
+                    # Skeleton and split units have a DWO id
+                    pos += 8
+                elif unit_type in (2, 6):
+                    # Type units, no code or data
+                    pos = unit_end
+                    continue
+            else:
+                abbrev_offset = number(pos, offset_size)
+                address_size = info[pos + offset_size]
+                pos += offset_size + 1
+
+            abbrevs = abbrev_tables.get(abbrev_offset)
+            if abbrevs is None:
+                abbrevs = abbrev_tables[abbrev_offset] = self._abbrevs(abbrev, abbrev_offset)
+
+            cu = {}
+            path = None
+            depth = 0
+            while pos < unit_end:
+                code, pos = _uleb(info, pos)
+                if code == 0:
+                    depth -= 1
+                    continue
+                tag, has_children, attributes = abbrevs[code]
+                values = {}
+                for at, form, implicit in attributes:
+                    while form == DW_FORM_indirect:
+                        form, pos = _uleb(info, pos)
+                    start = pos
+                    size = FIXED_FORM_SIZES.get(form)
+                    if size is not None:
+                        pos += size
+                        value = implicit if form == DW_FORM_implicit_const else number(start, size)
+                    elif form == DW_FORM_addr:
+                        pos += address_size
+                        value = number(start, address_size)
+                    elif form in OFFSET_FORMS or form == DW_FORM_ref_addr:
+                        size = address_size if form == DW_FORM_ref_addr and version == 2 else offset_size
+                        pos += size
+                        value = number(start, size)
+                    elif form in ULEB_FORMS:
+                        value, pos = _uleb(info, pos)
+                    elif form in SLEB_FORMS:
+                        value, pos = _sleb(info, pos)
+                    elif form == DW_FORM_string:
+                        pos = info.index(b"\0", pos) + 1
+                        value = info[start:pos - 1].decode(errors="replace")
+                    elif form in BLOCK_FORMS:
+                        length = number(pos, BLOCK_FORMS[form])
+                        pos += BLOCK_FORMS[form]
+                        value = info[pos:pos + length]
+                        pos += length
+                    elif form in ULEB_BLOCK_FORMS:
+                        length, pos = _uleb(info, pos)
+                        value = info[pos:pos + length]
+                        pos += length
+                    else:
+                        raise ValueError(f"Unknown DWARF form {form:#x} in unit at {unit_offset:#x}.")
+                    values[at] = (form, value)
+
+                if depth == 0 and tag in (DW_TAG_compile_unit, DW_TAG_partial_unit, DW_TAG_skeleton_unit):
+                    cu = values
+                    str_base = cu.get(DW_AT_str_offsets_base, (None, 8))[1]
+                    addr_base = cu.get(DW_AT_addr_base, (None, 8))[1]
+
+                    def attr_string(form, value):
+                        if form == DW_FORM_strp:
+                            return string(strings, value)
+                        if form == DW_FORM_line_strp:
+                            return string(line_strings, value)
+                        if form == DW_FORM_strx or DW_FORM_strx1 <= form <= DW_FORM_strx4:
+                            offset = str_offsets[str_base + value * offset_size:str_base + (value + 1) * offset_size]
+                            return string(strings, int.from_bytes(offset, byteorder))
+                        return value
+
+                    name = attr_string(*cu[DW_AT_name]) if DW_AT_name in cu else ""
+                    comp_dir = attr_string(*cu[DW_AT_comp_dir]) if DW_AT_comp_dir in cu else ""
+                    path = os.path.normpath(os.path.join(comp_dir, name)) if name else None
+                    unit_paths[unit_offset] = path
+                elif depth == 1 and path is not None:
+                    address = None
+                    if tag == DW_TAG_subprogram and DW_AT_low_pc in values:
+                        form, address = values[DW_AT_low_pc]
+                        if form == DW_FORM_addrx or DW_FORM_addrx1 <= form <= DW_FORM_addrx4:
+                            start = addr_base + address * address_size
+                            address = int.from_bytes(addr[start:start + address_size], byteorder)
+                    elif tag == DW_TAG_variable and DW_AT_location in values:
+                        expr = values[DW_AT_location][1]
+                        if isinstance(expr, bytes) and len(expr) == 1 + address_size and expr[0] == DW_OP_addr:
+                            address = int.from_bytes(expr[1:], byteorder)
+                    if address:
+                        addresses.setdefault(address, path)
+
+                if has_children:
+                    if depth >= 1 and DW_AT_sibling in values:
+                        # Nothing below the top level is needed
+                        pos = unit_offset + values[DW_AT_sibling][1]
+                    else:
+                        depth += 1
+            pos = unit_end
+
+        return SourceMap(addresses, self._aranges(unit_paths))
+
+    def _debug_section(self, name):
+        section = self.section(name)
+        return self.contents(section) if section is not None else b""
+
+    def _abbrevs(self, data, pos):
+        """{code: (tag, has children, [(attribute, form, implicit const)])} of the table at pos."""
+        table = {}
+        while True:
+            code, pos = _uleb(data, pos)
+            if code == 0:
+                return table
+            tag, pos = _uleb(data, pos)
+            has_children = data[pos]
+            pos += 1
+            attributes = []
+            while True:
+                at, pos = _uleb(data, pos)
+                form, pos = _uleb(data, pos)
+                if at == 0 and form == 0:
+                    break
+                implicit = None
+                if form == DW_FORM_implicit_const:
+                    implicit, pos = _sleb(data, pos)
+                attributes.append((at, form, implicit))
+            table[code] = (tag, has_children, attributes)
+
+    def _aranges(self, unit_paths):
+        data = self._debug_section(".debug_aranges")
+        ranges = []
+        pos = 0
+        while pos < len(data):
+            start = pos
+            length, offset_size = struct.unpack_from(self.endian + "I", data, pos)[0], 4
+            pos += 4
+            if length == 0xffffffff:
+                length, offset_size = struct.unpack_from(self.endian + "Q", data, pos)[0], 8
+                pos += 8
+            end = pos + length
+            pos += 2
+            unit_offset = struct.unpack_from(self.endian + ("Q" if offset_size == 8 else "I"), data, pos)[0]
+            address_size = data[pos + offset_size]
+            pos += offset_size + 2
+            # Tuples are aligned to twice the address size
+            pos = start + -(-(pos - start) // (2 * address_size)) * 2 * address_size
+            fmt = self.endian + ("QQ" if address_size == 8 else "II")
+            path = unit_paths.get(unit_offset)
+            while pos + 2 * address_size <= end:
+                address, size = struct.unpack_from(fmt, data, pos)
+                pos += 2 * address_size
+                if address == 0 and size == 0:
+                    break
+                if path is not None and size:
+                    ranges.append((address, address + size, path))
+            pos = end
+        ranges.sort()
+        return ranges
+
+    def compiler(self):
+        """Contents of .comment, the compiler identification, "" if missing."""
+        section = self.section(".comment")
+        if section is None:
+            return ""
+        return self.contents(section).replace(b"\0", b"\n").decode(errors="replace").strip()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Per symbol size differences of Zephyr builds.
+
+Compares the functions and objects in .text, .rodata, .data and .bss of an
+old build (e.g. the one without PQC) and a new build, ranks the symbols by
+their size change and sums the changes per PQM4 scheme. A symbol belongs
+to a scheme if the scheme name is a component of its source path or part
+of its (namespaced) name, all others are "other".
+
+With --matrix, every build is compared to the first one and only the
+totals per section and scheme are printed, one row per build. Symbol
+tables are cached per ELF hash (see elf_sizes.py) and read in parallel.
+
+Use:
+    elf_size_diff.py OLD_ELF NEW_ELF [--top N] [--sections text,rodata,...] [--csv]
+    elf_size_diff.py --matrix BASE_ELF [LABEL=]ELF... [--csv]
+"""
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from elf_sizes import symbol_table, path_components, TEXT, RODATA, DATA, BSS
+from print_tables import print_table, log
+from run_record import KNOWN_ALGORITHMS
+
+SECTIONS = [TEXT, RODATA, DATA, BSS]
+OTHER = "other"
+DEFAULT_TOP = 30
+
+
+def normalized(name):
+    """pqm4 directories are e.g. falcon-512 and rainbowI-classic, the schemes falcon512 and rainbowIclassic."""
+    return name.lower().replace("-", "").replace("_", "")
+
+
+def scheme_of(name, source):
+    components = {normalized(c) for c in path_components(source)}
+    name = normalized(name)
+    for alg in KNOWN_ALGORITHMS:
+        if normalized(alg) in components or normalized(alg) in name:
+            return alg
+    return OTHER
+
+
+def symbol_sizes(table, sections):
+    """{(section, name, source): size}, sizes of symbols with the same key are added."""
+    sizes = {}
+    for name, kind, _, size, source in table["symbols"]:
+        if kind in sections:
+            key = (kind, name, source)
+            sizes[key] = sizes.get(key, 0) + size
+    return sizes
+
+
+def diff(old, new, sections=SECTIONS):
+    """[(section, name, source, old size, new size)] of all symbols that changed."""
+    old, new = symbol_sizes(old, sections), symbol_sizes(new, sections)
+    changes = []
+    for key in old.keys() | new.keys():
+        before, after = old.get(key, 0), new.get(key, 0)
+        if before != after:
+            changes.append(key + (before, after))
+    # Largest change first
+    changes.sort(key=lambda c: (-abs(c[4] - c[3]), c[1]))
+    return changes
+
+
+def aggregate(changes):
+    """{scheme: {section: delta}}"""
+    schemes = {}
+    for kind, name, source, before, after in changes:
+        per_section = schemes.setdefault(scheme_of(name, source), dict.fromkeys(SECTIONS, 0))
+        per_section[kind] += after - before
+    return schemes
+
+
+def load_tables(paths, use_cache=True):
+    if len(paths) > 2:
+        with ProcessPoolExecutor() as executor:
+            return list(executor.map(symbol_table, paths, [use_cache] * len(paths)))
+    return [symbol_table(path, use_cache) for path in paths]
+
+
+def print_diff(changes, top, sections, csv):
+    rows = [[name, kind, source, before, after, after - before] for kind, name, source, before, after in changes[:top]]
+    print_table(["Symbol", "Section", "Source", "Old", "New", "Delta"], rows, csv)
+
+    schemes = aggregate(changes)
+    rows = [[scheme] + [deltas[s] for s in sections] + [sum(deltas.values())] for scheme, deltas in sorted(schemes.items())]
+    totals = [sum(row[i] for row in rows) for i in range(1, len(sections) + 2)]
+    print_table(["Scheme"] + sections + ["Total"], rows + [["total"] + totals], csv)
+
+
+def print_matrix(labels, tables, sections, csv):
+    base = tables[0]
+    per_build = [aggregate(diff(base, table, sections)) for table in tables[1:]]
+    schemes = sorted({scheme for schemes in per_build for scheme in schemes})
+
+    rows = []
+    for label, schemes_of_build in zip(labels[1:], per_build):
+        section_totals = [sum(deltas[s] for deltas in schemes_of_build.values()) for s in sections]
+        scheme_totals = [sum(schemes_of_build[scheme].values()) if scheme in schemes_of_build else 0 for scheme in schemes]
+        rows.append([label] + section_totals + scheme_totals + [sum(section_totals)])
+    print_table(["Build"] + sections + schemes + ["Total"], rows, csv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per symbol size differences of Zephyr builds.")
+    parser.add_argument("elfs", nargs="+", metavar="ELF", help="OLD NEW, or with --matrix the baseline and the builds ([LABEL=]ELF)")
+    parser.add_argument("--matrix", action="store_true", help="Compare every build to the first one")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Symbols to print (default %(default)s)")
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="Comma separated subset of %(default)s")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--csv", action="store_true")
+    args = parser.parse_args()
+
+    sections = args.sections.split(",")
+    if any(s not in SECTIONS for s in sections):
+        log(f"Sections are {', '.join(SECTIONS)}.")
+        sys.exit(1)
+    if not args.matrix and len(args.elfs) != 2:
+        log("Give the old and the new ELF, or use --matrix.")
+        sys.exit(1)
+
+    labels, paths = [], []
+    for spec in args.elfs:
+        label, sep, path = spec.partition("=")
+        labels.append(label if sep else spec)
+        paths.append(path if sep else spec)
+
+    try:
+        tables = load_tables(paths, not args.no_cache)
+    except (OSError, ValueError) as e:
+        log(e)
+        sys.exit(1)
+
+    if args.matrix:
+        print_matrix(labels, tables, sections, args.csv)
+    else:
+        print_diff(diff(*tables, sections), args.top, sections, args.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+ROM sizes of the modules of a Zephyr build, read from zephyr.elf directly
+instead of Zephyr's rom_report in Docker.
+
+Every sized function and object in a section that is stored in flash
+(.text, .rodata and the initial values of .data) is attributed to the
+source path of its compilation unit (DWARF debug information) or, without
+debug information, to the file of its STT_FILE symbol. A module is the sum
+of the symbols with the module name as path component or as symbol name,
+like the nodes of the rom_report tree filter_rom_report.py reads.
+
+Prints the same benchmarks as filter_rom_report.py plus elf_text_size:
+
+    rom_size_wolfssl,...
+    rom_size_PQM4,...
+    rom_size_ca_cert,...
+    elf_text_size,...
+
+The symbol table of an ELF is cached by its SHA-256, so repeated calls
+(and elf_size_diff.py) do not parse it again. Only the MAX_CACHED_TABLES
+most recently used tables are kept. Every build of a campaign is read
+once, so run_experiments.sh passes --no-cache.
+
+With --length SYMBOL=LENGTH_SYMBOL, SYMBOL counts with the initial value of
+LENGTH_SYMBOL instead of its size, e.g. the certificate in the slot of a
+patched firmware (see patch_firmware.py). The unused rest of SYMBOL is
+not counted in elf_text_size either.
+
+Use:
+    elf_sizes.py ELF [--module NAME]... [--length SYMBOL=LENGTH_SYMBOL]... [--no-cache]
+"""
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+
+from benchmark_cache import CACHE_DIR, atomic_write
+from elf_reader import ElfFile, SHF_ALLOC, SHF_EXECINSTR, SHF_WRITE, SHT_NOBITS, STT_FUNC, STT_OBJECT
+
+MODULE_NAMES = [
+    "wolfssl",
+    "PQM4",
+    "ca_cert",
+]
+
+SYMBOLS_VERSION = 1
+SYMBOLS_CACHE_PREFIX = "elf_symbols_"
+MAX_CACHED_TABLES = 64
+
+# Section kinds of the symbol table
+TEXT = "text"
+RODATA = "rodata"
+DATA = "data"
+BSS = "bss"
+ROM_KINDS = (TEXT, RODATA, DATA)
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def elf_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def section_kind(section):
+    if section.type == SHT_NOBITS:
+        return BSS
+    if section.flags & SHF_EXECINSTR:
+        return TEXT
+    if section.flags & SHF_WRITE:
+        return DATA
+    return RODATA
+
+
+def read_symbol_table(path):
+    """
+    {"text", "data", "bss": Berkeley sizes, "symbols": [[name, kind,
+    address, size, source path]]} of the sized functions and objects.
+    """
+    elf = ElfFile(path)
+    sources = elf.source_map()
+    text, data, bss = elf.berkeley_sizes()
+
+    symbols = []
+    for symbol in elf.symbols():
+        if symbol.type not in (STT_FUNC, STT_OBJECT) or not symbol.size:
+            continue
+        if not 0 < symbol.shndx < len(elf.sections):
+            continue
+        section = elf.sections[symbol.shndx]
+        if not section.flags & SHF_ALLOC:
+            continue
+        source = sources.path(symbol.value) or symbol.file or ""
+        symbols.append([symbol.name, section_kind(section), symbol.value, symbol.size, source])
+
+    return {"text": text, "data": data, "bss": bss, "symbols": symbols}
+
+
+def prune_symbol_tables(keep=MAX_CACHED_TABLES):
+    """Removes all but the keep most recently used cached symbol tables."""
+    paths = glob.glob(os.path.join(CACHE_DIR, f"{SYMBOLS_CACHE_PREFIX}*.json"))
+    paths.sort(key=lambda path: os.stat(path).st_mtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def symbol_table(path, use_cache=True):
+    """read_symbol_table of path, from the cache if the ELF was read before."""
+    if not use_cache:
+        return read_symbol_table(path)
+    cache_path = os.path.join(CACHE_DIR, f"{SYMBOLS_CACHE_PREFIX}{elf_hash(path)[:16]}.json")
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached["version"] == SYMBOLS_VERSION:
+            # mtime is the last use
+            os.utime(cache_path)
+            return cached["table"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    table = read_symbol_table(path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    atomic_write(cache_path, json.dumps({"version": SYMBOLS_VERSION, "table": table}), mode="w")
+    prune_symbol_tables()
+    return table
+
+
+def path_components(source):
+    return set(source.replace("\\", "/").split("/"))
+
+
+def initial_value(elf, name):
+    """Initial value of the integer symbol name of elf."""
+    symbol = elf.symbol(name)
+    offset = elf.file_offset(symbol.value) if symbol else None
+    if offset is None:
+        raise ValueError(f"No initialized symbol {name}")
+    return int.from_bytes(elf.data[offset:offset + symbol.size], "little" if elf.endian == "<" else "big")
+
+
+def module_sizes(table, modules=MODULE_NAMES, lengths={}):
+    """
+    {module: bytes in flash}, None for modules without symbols. lengths
+    {symbol: bytes} replaces the size of symbols that are only partly used.
+    """
+    sizes = dict.fromkeys(modules)
+    for name, kind, _, size, source in table["symbols"]:
+        if kind not in ROM_KINDS:
+            continue
+        size = min(size, lengths.get(name, size))
+        components = path_components(source)
+        for module in modules:
+            if name == module or module in components:
+                sizes[module] = (sizes[module] or 0) + size
+    return sizes
+
+
+def unused_bytes(table, lengths):
+    """Bytes in flash of the symbols in lengths beyond their used length, e.g. the padding of a patch slot."""
+    return sum(
+        size - min(size, lengths[name])
+        for name, kind, _, size, _ in table["symbols"] if kind in ROM_KINDS and name in lengths
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ROM sizes of the modules of a Zephyr build, like filter_rom_report.py.")
+    parser.add_argument("elf")
+    parser.add_argument("--module", action="append", default=[], help="Further module to report (repeatable)")
+    parser.add_argument("--length", action="append", default=[], metavar="SYMBOL=LENGTH_SYMBOL", help="Count SYMBOL with the value of LENGTH_SYMBOL (repeatable)")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        table = symbol_table(args.elf, not args.no_cache)
+        lengths = {}
+        if args.length:
+            elf = ElfFile(args.elf)
+            for spec in args.length:
+                name, _, length_name = spec.partition("=")
+                lengths[name] = initial_value(elf, length_name)
+    except (OSError, ValueError) as e:
+        log(f"Cannot read {args.elf}: {e}")
+        sys.exit(1)
+    if not any(source for _, _, _, _, source in table["symbols"]):
+        log(f"{args.elf} has no debug information or file symbols, modules cannot be attributed.")
+
+    sizes = module_sizes(table, MODULE_NAMES + args.module, lengths)
+    missing = [module for module, size in sizes.items() if size is None]
+    if missing:
+        log(f"Not all module sizes found! Missing: {', '.join(missing)}!")
+        sys.exit(1)
+
+    for module, size in sizes.items():
+        print(f"rom_size_{module},{size}")
+    # Without the padding, like the module sizes, which the derived columns subtract from it
+    print(f"elf_text_size,{table['text'] - unused_bytes(table, lengths)}")
+
+
+if __name__ == '__main__':
+    main()
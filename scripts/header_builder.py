@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Renders and installs the wolfssl headers of a testcase.
+
+scripts/build_header.py (KEMTLS) and scripts/pqtls/build_header.py (PQTLS)
+only differ in their paths and in the template variables of the two
+certificate algorithms, a HeaderBuilder holds those. Both certificate
+algorithms are called root and leaf here: the CA signature and the leaf
+KEM for KEMTLS, the root and leaf signature for PQTLS.
+"""
+import sys
+import os
+
+from c_array_emitter import c_array, incbin_c
+from header_cache import HeaderBatch, write_if_changed
+from patch_firmware import read_certificate, patch_certificate
+
+CERT_SUFFIX = "_ca.crt"
+
+
+def testcase_name(eph_kex_alg, root_alg, leaf_alg, testcase_num):
+    return f"{eph_kex_alg}_{root_alg}_{leaf_alg}_{testcase_num:04d}"
+
+
+def fill_template(template_path, **kwargs):
+    content = open(template_path).read()
+
+    for k in kwargs:
+        content = content.replace(f"${k}$", str(kwargs[k]))
+
+    return content
+
+
+def overwrite_header(header_path, content):
+    # Unchanged headers keep their mtime, so the build does not recompile what includes them
+    if write_if_changed(header_path, content):
+        print(f"Wrote {header_path}")
+    else:
+        print(f"{header_path} is unchanged, keeping it")
+
+
+def batch_key(testcase, patchable=False, incbin=None):
+    """Name of a testcase in a HeaderBatch, headers of other render options are stored apart."""
+    return testcase + ("_patchable" if patchable else "") + (f"_incbin={incbin}" if incbin else "")
+
+
+def get_option(name, default=None):
+    for i, arg in enumerate(sys.argv):
+        if arg == name and i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
+
+
+def check_path_exists_crash(path):
+    if not os.path.exists(path):
+        sys.stderr.write(f"Path {path} does not exist!")
+        sys.exit(1)
+
+
+class HeaderBuilder:
+    def __init__(self, certificate_path, template_path, cert_template_path, target_header_path,
+                 cert_target_header_path, firmware_path, root_alg_var, leaf_alg_var):
+        """root_alg_var and leaf_alg_var name the template variables of the certificate algorithms."""
+        self.certificate_path = certificate_path
+        self.template_path = template_path
+        self.cert_template_path = cert_template_path
+        self.target_header_path = target_header_path
+        self.cert_target_header_path = cert_target_header_path
+        self.firmware_path = firmware_path
+        self.root_alg_var = root_alg_var
+        self.leaf_alg_var = leaf_alg_var
+        self.ca_cert_blob_path = os.path.join(os.path.dirname(cert_target_header_path), "ca_cert.bin")
+        self.header_targets = {
+            os.path.basename(path): path for path in [target_header_path, cert_target_header_path, self.ca_cert_blob_path]
+        }
+
+    def certificate_index(self):
+        """{(root_alg, leaf_alg): {testcase number: path}} from one listing of the certificate path."""
+        index = {}
+        for name in os.listdir(self.certificate_path):
+            if not name.endswith(CERT_SUFFIX):
+                continue
+            parts = name[:-len(CERT_SUFFIX)].split("_")
+            if len(parts) == 3 and parts[2].isdigit():
+                index.setdefault((parts[0], parts[1]), {})[int(parts[2])] = os.path.join(self.certificate_path, name)
+        return index
+
+    def certificate_slot(self, paths):
+        """Size of the largest certificate of the combination, so all of them can be patched into one build."""
+        return max(len(read_certificate(path)) for path in paths)
+
+    def testcase_path(self, root_alg, leaf_alg, testcase_num):
+        return os.path.join(self.certificate_path, f"{root_alg}_{leaf_alg}_{testcase_num:04d}{CERT_SUFFIX}")
+
+    def render_headers(self, eph_kex_alg, root_alg, leaf_alg, ca_cert, ca_cert_slot=None, incbin=None):
+        """
+        {file name: content} of a testcase, the certificate slot defaults to its length.
+        With incbin, the certificate is a blob the assembler reads from that path.
+        """
+        headers = {}
+        if incbin:
+            headers[os.path.basename(self.ca_cert_blob_path)] = ca_cert
+            ca_cert_definition = incbin_c("ca_cert", incbin, ca_cert, ca_cert_slot)
+        else:
+            ca_cert_definition = c_array("ca_cert", ca_cert, ca_cert_slot)
+        template_vars = {
+            "eph_kex_alg": eph_kex_alg, self.root_alg_var: root_alg, self.leaf_alg_var: leaf_alg,
+            "ca_cert_len": len(ca_cert), "ca_cert_definition": ca_cert_definition,
+        }
+        headers[os.path.basename(self.target_header_path)] = fill_template(self.template_path, **template_vars)
+        headers[os.path.basename(self.cert_target_header_path)] = fill_template(self.cert_template_path, **template_vars)
+        return headers
+
+    def render_combination(self, batch, eph_kex_alg, root_alg, leaf_alg, patchable=False, incbin=None):
+        """Adds the headers of all testcases of the combination to batch, returns their number."""
+        testcases = self.certificate_index().get((root_alg, leaf_alg), {})
+        ca_cert_slot = self.certificate_slot(testcases.values()) if patchable and testcases else None
+        for testcase_num, path in sorted(testcases.items()):
+            batch.add(
+                    batch_key(testcase_name(eph_kex_alg, root_alg, leaf_alg, testcase_num), patchable, incbin),
+                    self.render_headers(eph_kex_alg, root_alg, leaf_alg, read_certificate(path), ca_cert_slot, incbin)
+            )
+        return len(testcases)
+
+    def render_batch(self, directory, kex_schemes, patchable=False, incbin=None):
+        """Pre-renders the headers of all testcases of a campaign into directory."""
+        batch = HeaderBatch(directory)
+        for (root_alg, leaf_alg) in sorted(self.certificate_index()):
+            for eph_kex_alg in kex_schemes:
+                self.render_combination(batch, eph_kex_alg, root_alg, leaf_alg, patchable, incbin)
+        batch.save()
+        return batch
+
+    def patch_firmware(self, testcase_path):
+        elf_path = os.path.join(self.firmware_path, "zephyr.elf")
+        bin_path = os.path.join(self.firmware_path, "zephyr.bin")
+        try:
+            slot = patch_certificate(elf_path, bin_path, read_certificate(testcase_path))
+        except (OSError, ValueError) as e:
+            sys.stderr.write(f"Cannot patch the firmware: {e}\n")
+            sys.exit(1)
+        print(f"Patched certificate into {slot} byte slot of {self.firmware_path}")
+
+
+def main(builder, kex_schemes, paths_to_check, alg_args):
+    """Command line of the build_header.py scripts, alg_args names the algorithm arguments in the usage."""
+    # --patchable: size the certificate array for all certificates of the combination
+    # --patch: write the certificate into the last build instead of the headers
+    # --from DIR: install the headers from DIR if they were pre-rendered there, else render them
+    # --batch DIR: pre-render the headers of all testcases into DIR
+    # --incbin PATH: include the certificate from ca_cert.bin, PATH is where the build finds it
+    batch_dir = get_option("--batch")
+    from_dir = get_option("--from")
+    incbin = get_option("--incbin")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--") and arg not in (batch_dir, from_dir, incbin)]
+
+    for path in paths_to_check:
+        check_path_exists_crash(path)
+
+    if batch_dir:
+        batch = builder.render_batch(batch_dir, kex_schemes, "--patchable" in sys.argv, incbin)
+        print(f"Rendered headers of {len(batch.index)} testcases into {batch_dir}")
+        return
+
+    if len(args) < 4:
+        sys.stderr.write(f"Not enough arguments submitted. Do a: {sys.argv[0]} {alg_args} TESTCASE_NUMBER [--patchable] [--patch|--from DIR] [--incbin PATH] or {sys.argv[0]} --batch DIR [--patchable] [--incbin PATH]")
+        sys.exit(1)
+
+    eph_kex_alg = args[0]
+    root_alg = args[1]
+    leaf_alg = args[2]
+    testcase_num = int(args[3])
+
+    testcase_path = builder.testcase_path(root_alg, leaf_alg, testcase_num)
+
+    print("Using", testcase_path)
+
+    check_path_exists_crash(testcase_path)
+
+    if "--patch" in sys.argv:
+        builder.patch_firmware(testcase_path)
+        return
+
+    if from_dir:
+        # Headers pre-rendered with --batch are installed, others are rendered for this testcase
+        # only, storing them would keep about a GB per Rainbow combination on disk
+        name = testcase_name(eph_kex_alg, root_alg, leaf_alg, testcase_num)
+        key = batch_key(name, "--patchable" in sys.argv, incbin)
+        batch = HeaderBatch(from_dir)
+        if key in batch.index:
+            written = batch.install(key, builder.header_targets)
+            print(f"Installed {len(written)} changed headers of {name}")
+            return
+        print(f"{name} is not pre-rendered in {from_dir}, rendering it")
+
+    ca_cert = read_certificate(testcase_path)
+    ca_cert_slot = builder.certificate_slot(builder.certificate_index()[root_alg, leaf_alg].values()) if "--patchable" in sys.argv else None
+
+    for name, content in builder.render_headers(eph_kex_alg, root_alg, leaf_alg, ca_cert, ca_cert_slot, incbin).items():
+        overwrite_header(builder.header_targets[name], content)
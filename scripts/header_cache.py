@@ -0,0 +1,86 @@
+"""
+Content-addressed writing of the generated wolfssl headers.
+
+A header is only written if its content differs from the file that is
+already there (by SHA-256), so its mtime stays and the Zephyr build does
+not recompile everything that includes it. Writes replace the file
+atomically.
+
+HeaderBatch pre-renders the headers of a whole campaign into a directory:
+every distinct header once as <sha256>.h plus index.json, which maps a
+testcase to the hashes of its headers. Installing a testcase copies only
+the headers whose hash differs from the installed ones.
+"""
+import os
+import json
+import hashlib
+
+from benchmark_cache import atomic_write
+
+INDEX_NAME = "index.json"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """SHA-256 of the file at path, None if there is none."""
+    try:
+        with open(path, "rb") as f:
+            return content_hash(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def encoded(content):
+    return content.encode() if isinstance(content, str) else content
+
+
+def write_if_changed(path, content):
+    """Writes content (str or bytes) to path unless it already has it. Returns whether it was written."""
+    data = encoded(content)
+    if file_hash(path) == content_hash(data):
+        return False
+    atomic_write(path, data)
+    return True
+
+
+class HeaderBatch:
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def add(self, testcase, headers):
+        """Stores headers {file name: content} of testcase, content is str or bytes (blobs)."""
+        os.makedirs(self.directory, exist_ok=True)
+        digests = {}
+        for name, content in headers.items():
+            digest = content_hash(encoded(content))
+            write_if_changed(os.path.join(self.directory, f"{digest}.h"), content)
+            digests[name] = digest
+        self.index[testcase] = digests
+
+    def save(self):
+        atomic_write(self.index_path, json.dumps(self.index, indent=1, sort_keys=True), mode="w")
+
+    def install(self, testcase, targets):
+        """
+        Copies the headers of testcase to targets {file name: path}.
+        Returns the paths that were written.
+        """
+        if testcase not in self.index:
+            raise KeyError(f"{testcase} is not in {self.index_path}")
+        written = []
+        for name, digest in self.index[testcase].items():
+            if file_hash(targets[name]) == digest:
+                continue
+            with open(os.path.join(self.directory, f"{digest}.h"), "rb") as f:
+                atomic_write(targets[name], f.read())
+            written.append(targets[name])
+        return written
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Linear model of the handshake time, fitted to the measured netem profiles.
+
+For every combination and profile the handshake time in seconds
+(cycles_connect / board clock) is modeled as
+
+    t = a * compute + n * delay + k * transfer + c
+
+    compute     sum of cycles_wc_pq_* / board clock
+    delay       one way delay of the profile (netem delays one direction,
+                so n is about the number of round trips)
+    transfer    (bytes_send + bytes_received) * 8 / bandwidth of the profile
+
+The coefficients are shared by all combinations of one protocol and fitted
+by least squares on the aggregates of print_tables. The fit error is
+reported in sample and leave-one-profile-out, i.e. for every profile with a
+model fitted to the other profiles only. Profiles are given in the naming of
+run_experiments.sh, e.g. 1mbit_13msdelay or 46kbit_1500msdelay.
+"""
+import re
+import sys
+import argparse
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy is not installed. Please do a `pip install numpy`.")
+    sys.exit(1)
+
+from print_tables import get_benchmarks, build_average, print_table, log
+
+# Clock of the EFM32GG11 on the STK3701A board
+DEFAULT_CLOCK_MHZ = 50
+
+PROFILE_RE = r"^([0-9.]+)(k|m|g)?bit_([0-9.]+)msdelay$"
+RATE_UNITS = {None: 1, "k": 10**3, "m": 10**6, "g": 10**9}
+CONNECT_PREFIX = "cycles_connect_"
+COMPUTE_PREFIX = "cycles_wc_pq_"
+
+COEFFICIENTS = ["compute", "delay", "transfer", "constant"]
+
+
+def parse_profile(name):
+    """'1mbit_13msdelay' -> (bandwidth in bit/s, delay in s)"""
+    m = re.match(PROFILE_RE, name)
+    if m is None:
+        raise ValueError(f"Profile {name} is not of the form <rate>[k|m|g]bit_<delay>msdelay.")
+    rate, unit, delay = m.groups()
+    return float(rate) * RATE_UNITS[unit], float(delay) / 1000
+
+
+def features(bench, profile, clock):
+    """Row of the design matrix, None if a benchmark is missing."""
+    rate, delay = parse_profile(profile)
+    compute = [val for name, val in bench.items() if name.startswith(COMPUTE_PREFIX)]
+    try:
+        transfer = (bench["bytes_send"] + bench["bytes_received"]) * 8 / rate
+    except KeyError:
+        return None
+    if not compute:
+        return None
+    return [sum(compute) / clock, delay, transfer, 1.]
+
+
+def build_rows(avg, clock):
+    """[(combination, profile, features, measured seconds)] of all measured profiles."""
+    rows = []
+    for comb in sorted(avg):
+        for name, cycles in avg[comb].items():
+            if not name.startswith(CONNECT_PREFIX):
+                continue
+            profile = name[len(CONNECT_PREFIX):]
+            try:
+                x = features(avg[comb], profile, clock)
+            except ValueError:
+                continue
+            if x is not None:
+                rows.append((comb, profile, x, cycles / clock))
+    return rows
+
+
+def fit(rows):
+    x = np.array([row[2] for row in rows])
+    y = np.array([row[3] for row in rows])
+    coef, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+    return coef
+
+
+def relative_errors(coef, rows):
+    x = np.array([row[2] for row in rows])
+    y = np.array([row[3] for row in rows])
+    return (x @ coef - y) / y
+
+
+def leave_one_profile_out(rows):
+    """{profile: relative errors of that profile with a model fitted to the others}"""
+    errors = {}
+    for profile in sorted({row[1] for row in rows}):
+        train = [row for row in rows if row[1] != profile]
+        test = [row for row in rows if row[1] == profile]
+        if not train:
+            continue
+        errors[profile] = relative_errors(fit(train), test)
+    return errors
+
+
+def predict(coef, avg, profile, clock):
+    """{combination: predicted cycles_connect} for the profile."""
+    res = {}
+    for comb in sorted(avg):
+        x = features(avg[comb], profile, clock)
+        if x is not None:
+            res[comb] = float(np.dot(coef, x) * clock)
+    return res
+
+
+def error_summary(errors):
+    return [
+        round(100 * float(np.mean(np.abs(errors))), 2),
+        round(100 * float(np.max(np.abs(errors))), 2),
+    ]
+
+
+def output(field_names, rows, csv):
+    # print_table truncates floats in csv, coefficients and errors need them
+    if csv:
+        print(",".join(field_names))
+        for row in rows:
+            print(",".join(str(f) for f in row))
+    else:
+        print_table(field_names, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit and evaluate a handshake latency model, predict unseen network profiles.")
+    parser.add_argument("path", help="Merged benchmark directory or archive")
+    parser.add_argument("--pqtls", action="store_true")
+    parser.add_argument("--stat", default="mean", help="Statistic of print_tables the model is fitted to")
+    parser.add_argument("--clock-mhz", type=float, default=DEFAULT_CLOCK_MHZ, help="Board clock (default %(default)s)")
+    parser.add_argument("--predict", action="append", default=[], metavar="PROFILE",
+                        help="Profile to predict, e.g. 10mbit_5msdelay (repeatable)")
+    parser.add_argument("--errors", action="store_true", help="Print the fit error of every combination and profile")
+    parser.add_argument("--csv", action="store_true")
+    args = parser.parse_args()
+
+    clock = args.clock_mhz * 10**6
+    try:
+        for profile in args.predict:
+            parse_profile(profile)
+    except ValueError as e:
+        log(e)
+        sys.exit(1)
+
+    avg = build_average(get_benchmarks(args.path, args.pqtls), args.stat)
+    rows = build_rows(avg, clock)
+    if len(rows) < len(COEFFICIENTS):
+        log("Not enough measured profiles to fit the model.")
+        sys.exit(1)
+
+    coef = fit(rows)
+    output(["Coefficient", "Value"], [[name, round(float(c), 4)] for name, c in zip(COEFFICIENTS, coef)], args.csv)
+
+    in_sample = relative_errors(coef, rows)
+    loo = leave_one_profile_out(rows)
+    summary = []
+    for profile in sorted(loo):
+        mask = np.array([row[1] == profile for row in rows])
+        summary.append([profile, int(mask.sum())] + error_summary(in_sample[mask]) + error_summary(loo[profile]))
+    output(["Profile", "Combinations", "Fit MAPE %", "Fit max %", "Held out MAPE %", "Held out max %"], summary, args.csv)
+
+    if args.errors:
+        output(
+            ["Combination", "Profile", "Measured", "Predicted", "Error %"],
+            [["_".join(comb), profile, round(y * clock), round(float(np.dot(coef, x) * clock)), round(100 * float(e), 2)]
+             for (comb, profile, x, y), e in zip(rows, in_sample)],
+            args.csv,
+        )
+
+    for profile in args.predict:
+        pred = predict(coef, avg, profile, clock)
+        output(["Combination", f"{CONNECT_PREFIX}{profile}", "Seconds"],
+                    [["_".join(comb), round(cycles), round(cycles / clock, 3)] for comb, cycles in pred.items()], args.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,249 @@
 #!/usr/bin/env python3
+"""
+Merges the profile subdirectories written by run_experiments.sh (one per
+netem profile, any name) into one file per testcase.
+
+Testcases are merged one at a time, so memory does not grow with the size
+of the campaign. Benchmarks matching PROFILE_METRICS (or --profile-metrics)
+are measured per profile and get the profile name as suffix, all others
+are written once, with the value of the last profile in name order.
+Every testcase has to exist in every profile, --skip-incomplete merges
+only the complete ones.
+
+Merges are incremental: a manifest in the user's cache directory records
+size, mtime and SHA-256 of every merged input file, so a rerun only merges
+testcases that are new or whose inputs changed (the hash is only computed
+if size or mtime differ) and leaves all other output files untouched.
+--full merges everything again.
+"""
+import os
+import re
 import sys
+import json
+import fnmatch
+import hashlib
 from pathlib import Path
-from collections import defaultdict as ddict
+from collections import Counter
+
+from benchmark_archive import write_archive, parse_value
+from benchmark_cache import CACHE_DIR, atomic_write
+from run_record import RunRecord, parse_run_fname, PROTOCOL_KEMTLS, PROTOCOL_PQTLS
 
-prefix_benchmarks = [
+# Benchmarks that differ per netem profile, as fnmatch patterns. Host side
+# timings of recv_benchmarks.py differ per profile as well.
+PROFILE_METRICS = [
     "cycles_connect",
     "ticks_connect",
     "cycles_send",
     "ticks_send",
     "cycles_recv",
     "ticks_recv",
+    "host_ms_*",
 ]
 
+
+def profile_metric_re(patterns):
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
+
+
+PROFILE_METRIC_RE = profile_metric_re(PROFILE_METRICS)
+
+
+MANIFEST_VERSION = 1
+
+
+def merged_name(name, profile, profile_metrics=PROFILE_METRIC_RE):
+    """Name of a benchmark of the given profile in the merged files."""
+    if profile_metrics.match(name):
+        return name + "_" + profile
+    return name
+
+
 def log(msg):
     print("[LOG]", msg, file=sys.stderr)
 
 
+def get_option(name, default=None):
+    for i, arg in enumerate(sys.argv):
+        if arg == name and i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+        if arg.startswith(name + "="):
+            return arg[len(name) + 1:]
+    return default
+
+
+def find_testcases(profiles, pqtls):
+    """{file name: (dims, profiles that have the file)}, only names are listed."""
+    testcases = {}
+    for profile in profiles:
+        log(f"Using subdir {profile}")
+        for file in profile.iterdir():
+            entry = testcases.get(file.name)
+            if entry is None:
+                try:
+                    dims = parse_run_fname(file.name, pqtls)
+                except ValueError:
+                    log(f"Filename is no benchmark file name, ignoring: {file}")
+                    continue
+                entry = testcases[file.name] = (dims, [])
+            entry[1].append(profile)
+    return testcases
+
+
+def merge_testcase(protocol, dims, fname, profiles, profile_metrics):
+    """Reads the testcase from all profiles into one RunRecord."""
+    record = RunRecord(protocol, *dims)
+    for profile in profiles:
+        with open(profile / fname) as f:
+            for benchmark in f:
+                name, sep, val = benchmark.strip().partition(",")
+                if not sep:
+                    continue
+                record.set(merged_name(name, profile.name, profile_metrics), parse_value(val, name))
+    return record
+
+
+def complete_testcases(profiles, pqtls, skip_incomplete=False):
+    """
+    {file name: (dims, profiles)} of the testcases to merge. Raises
+    ValueError if a testcase is missing in a profile.
+    """
+    testcases = find_testcases(profiles, pqtls)
+
+    incomplete = {fname for fname, (_, found) in testcases.items() if len(found) != len(profiles)}
+    if incomplete:
+        for fname in sorted(incomplete):
+            missing = sorted(p.name for p in set(profiles) - set(testcases[fname][1]))
+            log(f"{fname} is missing in {', '.join(missing)}")
+        if not skip_incomplete:
+            raise ValueError(f"{len(incomplete)} testcases are not in every profile.")
+        log(f"Skipping {len(incomplete)} incomplete testcases.")
+    return {fname: entry for fname, entry in testcases.items() if fname not in incomplete}
+
+
+def merge(testcases, pqtls, profile_metrics=PROFILE_METRIC_RE):
+    """Iterator of (file name, RunRecord) that merges the testcases one after the other."""
+    protocol = PROTOCOL_PQTLS if pqtls else PROTOCOL_KEMTLS
+    return (
+        (fname, merge_testcase(protocol, testcases[fname][0], fname, testcases[fname][1], profile_metrics))
+        for fname in sorted(testcases)
+    )
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class MergeManifest:
+    """
+    Inputs ({profile/file: [size, mtime_ns, sha256]}) and output stat of
+    every merged testcase of one output. Merges of another source or with
+    other profile metrics start from scratch.
+    """
+    def __init__(self, source, output, profile_metrics):
+        key = hashlib.sha256(os.path.realpath(output).encode()).hexdigest()[:16]
+        self.path = os.path.join(CACHE_DIR, f"merge_{key}.json")
+        self.source = os.path.realpath(source)
+        self.profile_metrics = profile_metrics.pattern
+        self.entries = {}
+
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            if (state["version"], state["source"], state["profile_metrics"]) == (MANIFEST_VERSION, self.source, self.profile_metrics):
+                self.entries = state["testcases"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def inputs(self, fname, profiles):
+        """
+        Current identities of the input files of a testcase and whether it
+        is "new", "changed" or None (merged before, nothing changed).
+        """
+        entry = self.entries.get(fname)
+        known = entry["inputs"] if entry else {}
+        identities = {}
+        changed = entry is None or len(known) != len(profiles)
+        for profile in profiles:
+            name = f"{profile.name}/{fname}"
+            stat = os.stat(profile / fname)
+            previous = known.get(name)
+            if previous and previous[:2] == [stat.st_size, stat.st_mtime_ns]:
+                identities[name] = previous
+                continue
+            digest = file_hash(profile / fname)
+            changed |= previous is None or previous[2] != digest
+            identities[name] = [stat.st_size, stat.st_mtime_ns, digest]
+        if entry is None:
+            return identities, "new"
+        return identities, "changed" if changed else None
+
+    def output_current(self, fname, path):
+        """Whether the output of the testcase is still the one written by the last merge."""
+        entry = self.entries.get(fname)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return entry is not None and entry["output"] == [stat.st_size, stat.st_mtime_ns]
+
+    def record(self, fname, identities, path):
+        stat = os.stat(path)
+        self.entries[fname] = {"inputs": identities, "output": [stat.st_size, stat.st_mtime_ns]}
+
+    def prune(self, fnames):
+        """Drops the testcases that are not in fnames any more, returns them."""
+        stale = self.entries.keys() - set(fnames)
+        for fname in stale:
+            del self.entries[fname]
+        return stale
+
+    def save(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        atomic_write(self.path, json.dumps({
+            "version": MANIFEST_VERSION,
+            "source": self.source,
+            "profile_metrics": self.profile_metrics,
+            "testcases": self.entries,
+        }), mode="w")
+
+
+def log_added(added, pqtls):
+    """Logs the new and changed testcases per combination."""
+    per_combination = Counter()
+    for fname, state in added.items():
+        kex, sig, leaf, _ = parse_run_fname(fname, pqtls)
+        comb = (sig, leaf, kex) if pqtls else (kex, sig, leaf)
+        per_combination["_".join(comb), state] += 1
+    for comb in sorted({comb for comb, _ in per_combination}):
+        log(f"{comb}: {per_combination[comb, 'new']} new, {per_combination[comb, 'changed']} changed testcases")
+
+
+FLAGS = ["--archive", "--pqtls", "--full", "--skip-incomplete"]
+OPTIONS = ["--profile-metrics"]
+
+
 def main():
+    archive = "--archive" in sys.argv
+    pqtls = "--pqtls" in sys.argv
+    full = "--full" in sys.argv
+    skip_incomplete = "--skip-incomplete" in sys.argv
+    patterns = get_option("--profile-metrics")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--") and arg != patterns]
+    unknown = [arg for arg in sys.argv[1:] if arg.startswith("--") and arg not in FLAGS and arg.split("=", 1)[0] not in OPTIONS]
     try:
-        dir = sys.argv[1]
-        output_dir = sys.argv[2]
+        if unknown:
+            print(f"Unknown option {', '.join(unknown)}")
+            raise IndexError()
+        dir = args[0]
+        output_dir = args[1]
     except IndexError:
-        print(f"Use: {sys.argv[0]} DIR OUTPUT_DIR")
+        print(f"Use: {sys.argv[0]} DIR OUTPUT_DIR [--pqtls] [--profile-metrics PATTERNS] [--skip-incomplete] [--full]")
+        print(f"     {sys.argv[0]} DIR OUTPUT_ARCHIVE --archive [--pqtls] [--profile-metrics PATTERNS] [--skip-incomplete] [--full]")
         sys.exit(1)
 
     path = Path(dir)
@@ -29,28 +251,64 @@ def main():
         print(f"dir is not a path.")
         sys.exit(2)
 
-    files = ddict(lambda: {})
+    profile_metrics = PROFILE_METRIC_RE
+    if patterns:
+        profile_metrics = profile_metric_re(PROFILE_METRICS + patterns.split(","))
 
-    for subdir in path.iterdir():
-        if subdir.is_dir():
-            log(f"Using subdir {subdir}")
-            for file in subdir.iterdir():
-                benchmarks = [x.strip() for x in open(file).readlines()]
-                for benchmark in benchmarks:
-                    name, val = benchmark.split(",")
-                    if name in prefix_benchmarks:
-                        name = name + "_" + subdir.name
-                    files[file.name][name] = val
+    profiles = sorted(subdir for subdir in path.iterdir() if subdir.is_dir())
+    try:
+        testcases = complete_testcases(profiles, pqtls, skip_incomplete)
+    except ValueError as e:
+        log(e)
+        sys.exit(1)
 
+    manifest = MergeManifest(dir, output_dir, profile_metrics)
+    if full:
+        manifest.entries = {}
     out_path = Path(output_dir)
+    identities = {}
+    added = {}
+    for fname, (_, found) in testcases.items():
+        identities[fname], state = manifest.inputs(fname, found)
+        output = out_path if archive else out_path / fname
+        if state is None and not manifest.output_current(fname, output):
+            state = "changed"
+        if state is not None:
+            added[fname] = state
+        else:
+            # Only the mtime changed, no need to hash again next time
+            manifest.entries[fname]["inputs"] = identities[fname]
+    removed = manifest.prune(testcases)
+    for fname in sorted(removed):
+        log(f"{fname} is not in {dir} any more" + ("." if archive else ", keeping its merged file."))
+
+    if not added and not (archive and removed):
+        log(f"Nothing new, {len(testcases)} testcases are merged already.")
+        manifest.save()
+        return
+    log_added(added, pqtls)
+
+    if archive:
+        # Archives are columnar, they are built from all testcases at once
+        write_archive(output_dir, (
+            ("", fname, dict(record.items())) for fname, record in merge(testcases, pqtls, profile_metrics)
+        ))
+        for fname in testcases:
+            manifest.record(fname, identities[fname], out_path)
+        manifest.save()
+    else:
+        if not out_path.exists():
+            out_path.mkdir(parents=True)
+        try:
+            for fname, record in merge({fname: testcases[fname] for fname in added}, pqtls, profile_metrics):
+                atomic_write(out_path / fname, "".join(f"{name},{val}\n" for name, val in record.items()), mode="w")
+                manifest.record(fname, identities[fname], out_path / fname)
+        finally:
+            # Interrupted merges continue where they stopped
+            manifest.save()
 
-    if not out_path.exists():
-        out_path.mkdir(parents=True)
+    log(f"Merged {len(added)} of {len(testcases)} testcases.")
 
-    for file in files:
-        with open(out_path / Path(file), "w") as f:
-            for bench_name, val in files[file].items(): 
-               f.write(f"{bench_name},{val}\n")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
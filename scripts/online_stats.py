@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Incremental statistics of a running campaign.
+
+For every (combination, profile, metric) an accumulator keeps the count,
+mean and variance (Welford) and a mergeable quantile sketch with bounded
+relative error (log-spaced buckets). Memory does not grow with the number
+of runs, runs can be added one at a time and states of several hosts can
+be merged.
+
+Use:
+    online_stats.py update STATE PROFILE RUN_FILE... [--combination COMB] [--pqtls]
+    online_stats.py merge OUT_STATE STATE...
+    online_stats.py table STATE [--stat mean|std|min|max|n|pNN] [--profile P] [--csv]
+"""
+import os
+import sys
+import math
+import json
+
+from benchmark_cache import atomic_write
+from benchmark_archive import parse_value
+from run_record import parse_run_fname
+
+STATE_VERSION = 1
+SKETCH_ALPHA = 0.01
+SKETCH_MAX_BUCKETS = 2048
+KEY_SEP = "|"
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+class QuantileSketch:
+    """
+    Quantiles with relative error alpha: values are counted in buckets
+    with boundaries gamma^k. Merging adds bucket counts.
+    """
+    def __init__(self, alpha=SKETCH_ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.pos = {}
+        self.neg = {}
+        self.zero = 0
+
+    def add(self, x, count=1):
+        if x > 0:
+            k = math.ceil(math.log(x) / self.log_gamma)
+            self.pos[k] = self.pos.get(k, 0) + count
+        elif x < 0:
+            k = math.ceil(math.log(-x) / self.log_gamma)
+            self.neg[k] = self.neg.get(k, 0) + count
+        else:
+            self.zero += count
+        self._collapse(self.pos)
+        self._collapse(self.neg)
+
+    def _collapse(self, buckets):
+        # Folds the smallest magnitudes together to keep memory bounded
+        while len(buckets) > SKETCH_MAX_BUCKETS:
+            lowest, second = sorted(buckets)[:2]
+            buckets[second] += buckets.pop(lowest)
+
+    def _value(self, k):
+        return 2 * self.gamma ** k / (self.gamma + 1)
+
+    def count(self):
+        return sum(self.pos.values()) + sum(self.neg.values()) + self.zero
+
+    def quantile(self, q):
+        n = self.count()
+        if n == 0:
+            return math.nan
+        rank = q * (n - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zero
+        if seen > rank:
+            return 0.
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.pos))
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches with different accuracy.")
+        for mine, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in theirs.items():
+                mine[k] = mine.get(k, 0) + c
+            self._collapse(mine)
+        self.zero += other.zero
+
+    def to_json(self):
+        return {"alpha": self.alpha, "pos": self.pos, "neg": self.neg, "zero": self.zero}
+
+    @classmethod
+    def from_json(cls, d):
+        sketch = cls(d["alpha"])
+        sketch.pos = {int(k): c for k, c in d["pos"].items()}
+        sketch.neg = {int(k): c for k, c in d["neg"].items()}
+        sketch.zero = d["zero"]
+        return sketch
+
+
+class RunningStats:
+    """Count, mean, variance (Welford), min, max and quantiles of one metric."""
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        self.sketch.add(x)
+
+    def merge(self, other):
+        # Chan et al. parallel variance
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else math.nan
+
+    def stat(self, name):
+        if name == "mean":
+            return self.mean if self.n else math.nan
+        if name == "std":
+            return self.std()
+        if name == "min":
+            return self.min if self.n else math.nan
+        if name == "max":
+            return self.max if self.n else math.nan
+        if name == "n":
+            return self.n
+        if name == "median":
+            return self.sketch.quantile(.5)
+        if name.startswith("p"):
+            return self.sketch.quantile(float(name[1:]) / 100)
+        raise ValueError(f"Unknown statistic {name}.")
+
+    def to_json(self):
+        return {"n": self.n, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max,
+                "sketch": self.sketch.to_json()}
+
+    @classmethod
+    def from_json(cls, d):
+        stats = cls()
+        stats.n, stats.mean, stats.m2, stats.min, stats.max = d["n"], d["mean"], d["m2"], d["min"], d["max"]
+        stats.sketch = QuantileSketch.from_json(d["sketch"])
+        return stats
+
+
+class OnlineStats:
+    """RunningStats per (combination, profile, metric)."""
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, combination, profile, metric):
+        key = (combination, profile, metric)
+        if key not in self.entries:
+            self.entries[key] = RunningStats()
+        return self.entries[key]
+
+    def add_run(self, combination, profile, benchmarks):
+        for name, val in benchmarks.items():
+            if isinstance(val, (int, float)):
+                self.get(combination, profile, name).add(val)
+
+    def merge(self, other):
+        for key, stats in other.entries.items():
+            self.get(*key).merge(stats)
+
+    def combinations(self):
+        return sorted({(comb, profile) for comb, profile, _ in self.entries})
+
+    def metrics(self):
+        return list(dict.fromkeys(metric for _, _, metric in self.entries))
+
+    def save(self, path):
+        state = {
+            "version": STATE_VERSION,
+            "entries": {KEY_SEP.join(key): stats.to_json() for key, stats in self.entries.items()},
+        }
+        atomic_write(path, json.dumps(state), mode="w")
+
+    @classmethod
+    def load(cls, path):
+        online = cls()
+        if not os.path.exists(path):
+            return online
+        with open(path) as f:
+            state = json.load(f)
+        if state["version"] != STATE_VERSION:
+            raise ValueError(f"State {path} has unsupported version {state['version']}.")
+        for key, stats in state["entries"].items():
+            online.entries[tuple(key.split(KEY_SEP))] = RunningStats.from_json(stats)
+        return online
+
+
+def read_run_file(path):
+    benchmarks = {}
+    with open(path) as f:
+        for line in f:
+            name, _, val = line.strip().partition(",")
+            if name:
+                benchmarks[name] = parse_value(val, name)
+    return benchmarks
+
+
+def combination_of(fname, pqtls=False):
+    """
+    kyber512_falcon512_kyber512_12.txt -> kyber512_falcon512_kyber512, as
+    kex_sig_leaf like print_tables.py also for PQTLS (root_leaf_kex_N.txt).
+    """
+    return "_".join(parse_run_fname(os.path.basename(fname), pqtls)[:3])
+
+
+def build_table(online, stat, profile=None, metrics=None):
+    metrics = metrics or online.metrics()
+    rows = []
+    for comb, prof in online.combinations():
+        if profile is not None and prof != profile:
+            continue
+        row = [comb, prof]
+        for metric in metrics:
+            stats = online.entries.get((comb, prof, metric))
+            val = stats.stat(stat) if stats else math.nan
+            row.append("" if isinstance(val, float) and math.isnan(val) else val)
+        rows.append(row)
+    return ["Combination", "Profile"] + metrics, rows
+
+
+def usage():
+    print(__doc__.split("Use:")[1])
+    sys.exit(1)
+
+
+def get_option(args, name, default=None):
+    if name in args:
+        i = args.index(name)
+        if i + 1 == len(args):
+            print(f"{name} needs a value.")
+            usage()
+        value = args[i + 1]
+        del args[i:i + 2]
+        return value
+    return default
+
+
+def main():
+    args = sys.argv[1:]
+    csv = "--csv" in args
+    pqtls = "--pqtls" in args
+    args = [arg for arg in args if arg not in ("--csv", "--pqtls")]
+    combination = get_option(args, "--combination")
+    stat = get_option(args, "--stat", "mean")
+    profile = get_option(args, "--profile")
+
+    try:
+        cmd, state_path = args[0], args[1]
+        rest = args[2:]
+        if cmd == "update" and len(rest) < 2 or cmd == "merge" and not rest:
+            raise IndexError()
+    except IndexError:
+        usage()
+
+    if cmd == "update":
+        online = OnlineStats.load(state_path)
+        run_profile, run_files = rest[0], rest[1:]
+        for run_file in run_files:
+            try:
+                run_combination = combination or combination_of(run_file, pqtls)
+            except ValueError:
+                log(f"Filename is no benchmark file name, ignoring: {run_file}")
+                continue
+            online.add_run(run_combination, run_profile, read_run_file(run_file))
+        online.save(state_path)
+    elif cmd == "merge":
+        online = OnlineStats()
+        for path in rest:
+            online.merge(OnlineStats.load(path))
+        online.save(state_path)
+    elif cmd == "table":
+        field_names, rows = build_table(OnlineStats.load(state_path), stat, profile)
+        if csv:
+            print(",".join(field_names))
+            for row in rows:
+                print(",".join(str(f) for f in row))
+        else:
+            try:
+                from tabulate import tabulate
+            except ImportError:
+                print("tabulate is not installed. Please do a `pip install tabulate`.")
+                sys.exit(1)
+            print(tabulate(rows, field_names, tablefmt="pretty"))
+    else:
+        usage()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Writes a CA certificate into a prebuilt firmware instead of building it
+again for every testcase.
+
+The firmware has to be built with a certificate slot (build_header.py
+--patchable), i.e. ca_cert is an array of the largest certificate size of
+the combination and ca_cert_len holds the actual length. Both are located
+by their symbols in zephyr.elf and patched there and in zephyr.bin (at the
+load address, ca_cert_len is initialized data). The rest of the slot is
+zeroed. Before patching, the bytes of the binary have to match the ELF,
+afterwards both files are read back and compared. The EFM32 images have no
+checksum that would have to be recomputed.
+
+Use:
+    patch_firmware.py CERT ELF [BIN]
+"""
+import sys
+import base64
+
+from benchmark_cache import atomic_write
+from elf_reader import ElfFile
+
+CERT_SYMBOL = "ca_cert"
+LENGTH_SYMBOL = "ca_cert_len"
+PEM_BEGIN = b"-----BEGIN"
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def read_certificate(path):
+    """DER bytes of a PEM (or DER) certificate file."""
+    with open(path, "rb") as f:
+        content = f.read()
+    if not content.startswith(PEM_BEGIN):
+        return content
+    # Remove header and footer line (---- [...] ----)
+    return base64.b64decode(b"".join(content.splitlines()[1:-1]))
+
+
+def certificate_patches(elf, cert):
+    """[(address, bytes)] that put cert into the slot of elf."""
+    slot = elf.symbol(CERT_SYMBOL)
+    length = elf.symbol(LENGTH_SYMBOL)
+    if slot is None or length is None:
+        raise ValueError(f"Firmware has no {CERT_SYMBOL} and {LENGTH_SYMBOL} symbols.")
+    if len(cert) > slot.size:
+        raise ValueError(f"Certificate has {len(cert)} bytes, the slot only {slot.size}. Build with a larger slot.")
+    byteorder = "little" if elf.endian == "<" else "big"
+    return [
+        (slot.value, cert + bytes(slot.size - len(cert))),
+        (length.value, len(cert).to_bytes(length.size, byteorder)),
+    ]
+
+
+def patch_certificate(elf_path, bin_path, cert):
+    """Patches cert into zephyr.elf and, if given, zephyr.bin. Returns the slot size."""
+    elf = ElfFile(elf_path)
+    patches = certificate_patches(elf, cert)
+    elf_data = bytearray(elf.data)
+    bin_data = None
+    if bin_path:
+        with open(bin_path, "rb") as f:
+            bin_data = bytearray(f.read())
+
+    located = []
+    for address, new in patches:
+        offset = elf.file_offset(address)
+        if offset is None:
+            raise ValueError(f"{address:#x} has no initial contents in {elf_path}.")
+        bin_offset = None
+        if bin_data is not None:
+            bin_offset = elf.binary_offset(address)
+            if bin_data[bin_offset:bin_offset + len(new)] != elf_data[offset:offset + len(new)]:
+                raise ValueError(f"{bin_path} does not match {elf_path} at {address:#x}, was it built from it?")
+            bin_data[bin_offset:bin_offset + len(new)] = new
+        elf_data[offset:offset + len(new)] = new
+        located.append((offset, bin_offset, new))
+
+    atomic_write(elf_path, bytes(elf_data))
+    if bin_data is not None:
+        atomic_write(bin_path, bytes(bin_data))
+
+    # Read back what was written
+    elf_data = ElfFile(elf_path).data
+    if bin_data is not None:
+        with open(bin_path, "rb") as f:
+            bin_data = f.read()
+    for offset, bin_offset, new in located:
+        if elf_data[offset:offset + len(new)] != new or bin_data is not None and bin_data[bin_offset:bin_offset + len(new)] != new:
+            raise ValueError("Patched firmware does not contain the certificate.")
+
+    return len(patches[0][1])
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(f"Use: {sys.argv[0]} CERT ELF [BIN]")
+        sys.exit(1)
+    cert = read_certificate(sys.argv[1])
+    try:
+        slot = patch_certificate(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, cert)
+    except (OSError, ValueError) as e:
+        log(e)
+        sys.exit(1)
+    log(f"Patched {len(cert)} byte certificate into {slot} byte slot.")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,12 +14,28 @@ ZEPHYR_ELF_PATH=${WORKSPACE_PATH}/build/zephyr/zephyr.elf
 
 IFACE_NAME=enp0s25
 NUM_ITERS=1000
+# A stalled board is reset and the round retried, see recv_benchmarks.py
+READ_TIMEOUT=300
+RUN_TIMEOUT=1800
+MAX_ATTEMPTS=3
+# 1: build once per algorithm combination and patch the certificate of the
+# other testcases into zephyr.bin instead of rebuilding, see patch_firmware.py
+PATCH_FIRMWARE=0
+BUILT_COMBINATION=""
+# Headers pre-rendered with build_header.py --batch, testcases that are not in
+# there are rendered when they are built. Only changed ones are installed, so
+# the build stays incremental. Not below BENCHMARKS_DIR, its subdirectories
+# are the netem profiles.
+HEADERS_DIR=benchmarks/pqtls_headers
+RUN_OUTPUT=/tmp/pqtls_run.txt
 
 TC_PARAMS=("dev ${IFACE_NAME} root netem delay 13ms rate 1mbit" "dev ${IFACE_NAME} root netem delay 60ms rate 1mbit" "dev ${IFACE_NAME} root netem delay 1500ms rate 46kbit")
 TC_PARAMS_NAMES=("1mbit_13msdelay" "1mbit_60msdelay" "46kbit_1500msdelay")
 
 
 BENCHMARKS_DIR="benchmarks/pqtls/"
+# Running statistics, see `scripts/online_stats.py table ${ONLINE_STATS}`
+ONLINE_STATS=${BENCHMARKS_DIR}/online_stats.json
 
 HOST_IP="192.0.2.1"
 IP_SET=$(ip a|grep ${HOST_IP}|echo $?)
@@ -66,19 +82,26 @@ for ROOT_SIG_ALG in $SIG_ALGS; do
                 continue
             fi
 
-            echo "  Patching headers of zephyr/wolfssl"
-            scripts/pqtls/build_header.py $KEX_ALG $ROOT_SIG_ALG $LEAF_SIG_ALG $i
-
-            echo "  Building zephyr/wolfssl"
-            scripts/pqtls/build_wolfssl.sh
-            # run ROM analysis only on first build, because its slow
-            # and doesnt change for different keys.
+            if [ "$PATCH_FIRMWARE" -eq 1 ] && [ "$BUILT_COMBINATION" == "${KEX_ALG}_${ROOT_SIG_ALG}_${LEAF_SIG_ALG}" ]; then
+                echo "  Patching certificate into zephyr/wolfssl"
+                scripts/pqtls/build_header.py $KEX_ALG $ROOT_SIG_ALG $LEAF_SIG_ALG $i --patch
+            else
+                echo "  Patching headers of zephyr/wolfssl"
+                scripts/pqtls/build_header.py $KEX_ALG $ROOT_SIG_ALG $LEAF_SIG_ALG $i --from ${HEADERS_DIR} $([ "$PATCH_FIRMWARE" -eq 1 ] && echo --patchable)
+                echo "  Building zephyr/wolfssl"
+                scripts/pqtls/build_wolfssl.sh
+                BUILT_COMBINATION=${KEX_ALG}_${ROOT_SIG_ALG}_${LEAF_SIG_ALG}
+            fi
+            # ROM analysis reads the ELF directly, so it runs on every build
+            echo "  Running ROM analysis"
+            scripts/elf_sizes.py $ZEPHYR_ELF_PATH --length ca_cert=ca_cert_len --no-cache > ${BENCHMARK_PATH}
+            # Lets print_tables.py find the baselines measured by scripts/calibration.py
+            CALIBRATION_KEY=$(scripts/calibration.py key --elf $ZEPHYR_ELF_PATH --config ${WORKSPACE_PATH}/build/zephyr/.config)
+            echo "calibration_key,${CALIBRATION_KEY}" >> ${BENCHMARK_PATH}
+            # Stack usage does not change for different keys
             if [ $i -eq 1 ]; then
-                echo "  Running ROM analysis"
-                scripts/rom_report_wolfssl.sh $ZEPHYR_WORKSPACE|scripts/filter_rom_report.py > ${BENCHMARK_PATH}
-                echo " Reading overall .text segment size"
-                ELF_SIZE=$(arm-none-eabi-size $ZEPHYR_ELF_PATH | tail -n 1 | cut -d' ' -f2)
-                echo "elf_text_size,${ELF_SIZE}" >> ${BENCHMARK_PATH}
+                echo "  Running stack analysis"
+                scripts/stack_analysis.py ${WORKSPACE_PATH}/build --elf $ZEPHYR_ELF_PATH --store ${CALIBRATION_KEY} > /dev/null || echo "  No call graph in the build, keeping the published stack figures"
             fi
             echo "  Flashing zephyr to board"
             scripts/pqtls/flash_zephyr.sh
@@ -93,31 +116,45 @@ for ROOT_SIG_ALG in $SIG_ALGS; do
                     echo " Adding network parameters: $(echo ${TC_PARAMS[$TC_NUM]})"|tee -a progress.log
                     sudo tc qdisc add $(echo ${TC_PARAMS[$TC_NUM]})
                     echo " Starting round ${i} with ${TC_PARAMS_NAMES[$TC_NUM]}..."
-                    echo "  Launching server"
-                    scripts/pqtls/launch_server.sh $ROOT_SIG_ALG ${LEAF_SIG_ALG} $KEX_ALG $i > /tmp/pqtls_server.log 2>&1 &
-
-                    echo "  Waiting for server to come up"
-                    SERVER_UP="n"
-                    for j in {1..10}; do
-                        NC_RET=$(lsof -i4 -iTCP:${SERVER_PORT}|echo "$?")
-                        if [ "$NC_RET" -eq "0" ]; then
-                            SERVER_UP="y"
-                            break;
+                    for ATTEMPT in $(seq 1 ${MAX_ATTEMPTS}); do
+                        echo "  Launching server"
+                        scripts/pqtls/launch_server.sh $ROOT_SIG_ALG ${LEAF_SIG_ALG} $KEX_ALG $i > /tmp/pqtls_server.log 2>&1 &
+
+                        echo "  Waiting for server to come up"
+                        SERVER_UP="n"
+                        for j in {1..10}; do
+                            NC_RET=$(lsof -i4 -iTCP:${SERVER_PORT}|echo "$?")
+                            if [ "$NC_RET" -eq "0" ]; then
+                                SERVER_UP="y"
+                                break;
+                            fi
+                            echo "  Server didn't come up yet."
+                        done
+
+                        if [ "$SERVER_UP" == "n" ]; then
+                            echo "  Server didn't start. Exiting."
+                            exit 1
                         fi
-                        echo "  Server didn't come up yet."
-                    done
 
-                    if [ "$SERVER_UP" == "n" ]; then
-                        echo "  Server didn't start. Exiting."
+                        echo "  Server Up. Reseting Board."
+                        RESET_TIME=$(date +%s.%N)
+                        ./scripts/restart_device.sh
+                        echo "  Waiting for handshake to finish"
+                        RECV_RET=0
+                        ./scripts/recv_benchmarks.py --read-timeout ${READ_TIMEOUT} --run-timeout ${RUN_TIMEOUT} --reset-time ${RESET_TIME} > ${RUN_OUTPUT} || RECV_RET=$?
+                        echo "  Killing server"
+                        pkill -f pqtls_server
+                        if [ "$RECV_RET" -ne "2" ]; then
+                            break
+                        fi
+                        echo "  Board timed out (attempt ${ATTEMPT}/${MAX_ATTEMPTS}). Resetting and retrying."|tee -a progress.log
+                    done
+                    cat ${RUN_OUTPUT} >> ${BENCHMARK_PATH}
+                    if [ "$RECV_RET" -ne "0" ]; then
+                        echo "  Receiving benchmarks failed. Exiting."
                         exit 1
                     fi
-
-                    echo "  Server Up. Reseting Board."
-                    ./scripts/restart_device.sh
-                    echo "  Waiting for handshake to finish"
-                    ./scripts/recv_benchmarks.py >> ${BENCHMARK_PATH}
-                    echo "  Killing server"
-                    pkill -f pqtls_server
+                    scripts/online_stats.py update ${ONLINE_STATS} ${TC_PARAMS_NAMES[$TC_NUM]} ${BENCHMARK_PATH} --pqtls
             done
         done
     done
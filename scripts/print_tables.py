@@ -9,9 +9,21 @@ except ImportError:
     print("tabulate is not installed. Please do a `pip install tabulate`.")
     sys.exit(1)
 import random
+import time
+from itertools import repeat
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmark_engine import BenchmarkFrame, is_statistic, is_location_statistic, parse_outlier_method, DEFAULT_OUTLIER_METRICS, PERCENTILE_RE
+from benchmark_cache import ParseCache
+from benchmark_archive import BenchmarkArchive, is_archive, parse_value
+from online_stats import OnlineStats
+from dir_watcher import DirWatcher
+from merge_benchmarks import merged_name
+from run_record import RunRecord, parse_run_fname, PROTOCOL_KEMTLS, PROTOCOL_PQTLS
+from calibration import load_calibration
 
 
-BENCHMARK_FILE_RE = r"([A-z0-9]+)_([A-z0-9]+)_([A-z0-9]+)_([0-9]+).txt"
 DESIRED_BENCHMARKS = [
     "rom_size_wolfssl",
 #     "rom_size_PQClean",
@@ -37,7 +49,6 @@ DESIRED_BENCHMARKS = [
     "cycles_recv_46kbit_1500msdelay",
 ]
 
-PQTLS_BENCHMARK_FILE_RE = r"([A-z0-9]+)_([A-z0-9]+)_([A-z0-9]+)_([0-9]+).txt"
 PQTLS_DESIRED_BENCHMARKS = [
     "rom_size_wolfssl",
     # "rom_size_PQClean",
@@ -82,6 +93,26 @@ PQTLS_PAPER_TABLE2 = [
 ]
 
 
+NETEM_PROFILES = ["1mbit_13msdelay", "1mbit_60msdelay", "46kbit_1500msdelay",]
+
+# Inputs of the columns that are not in the benchmark files but derived by
+# get_benchmarks and calc_additional_columns. The *_stack columns come from
+# STACK_BENCHMARKS and need no input.
+DERIVED_COLUMN_INPUTS = {
+    "rom_size_PQM4_calculated": ["elf_text_size"],
+    "rom_size_wolfssl_wo_pqm4": [],
+    "rom_size_wolfssl_complete": ["rom_size_wolfssl_wo_pqm4", "rom_size_PQM4_calculated"],
+    "pqm4_code_wo_cert": ["rom_size_PQM4_calculated", "rom_size_ca_cert"],
+    "pqm4_code_percent": ["pqm4_code_wo_cert", "rom_size_wolfssl_complete"],
+    "certificate_percent": ["rom_size_ca_cert", "rom_size_wolfssl_complete"],
+    "bytes_traffic": ["bytes_send", "bytes_received"],
+    "wolfssl_max_mem_usage": ["peak_mem"],
+}
+# Share of a handshake spent in PQM4, one column per profile
+HANDSHAKE_PQM4_PREFIX = "handshake_cycles_spend_in_pqm4_"
+PQM4_CYCLES = ["cycles_wc_pq_make_keypair", "cycles_wc_pq_kem_dec", "cycles_wc_pq_verify_hash", "cycles_wc_pq_kem_encapsulate"]
+PQTLS_PQM4_CYCLES = ["cycles_wc_pq_make_keypair", "cycles_wc_pq_kem_dec", "cycles_wc_pq_verify_hash_0", "cycles_wc_pq_verify_hash_1"]
+
 # This is the .text section of our binary if there is no PQC included
 KEMTLS_TEXT_BASE_SIZE = 180864
 PQTLS_TEXT_BASE_SIZE = 185568
@@ -118,6 +149,14 @@ STACK_BENCHMARKS = {
 
 RAINBOW_PK_SIZE = 161600
 
+# Below this many files to parse, starting worker processes is not worth it.
+# Measured on 4050 run files: 0.059 ms per file parsed in process, a pool
+# costs 15 ms to start plus 0.027 ms per file to pass the result back, so
+# it breaks even at about 470 files with 4 and 940 files with 2 CPUs.
+PARALLEL_MIN_FILES = 1024
+# Statistics of online_stats.RunningStats, besides pNN
+FOLLOW_STATISTICS = ["mean", "median", "std", "min", "max", "n"]
+
 
 
 
@@ -125,103 +164,278 @@ def log(msg):
     print("[LOG]", msg, file=sys.stderr)
 
 
-def read_benchmark_file(path):
-    if not os.path.isfile(path):
-        raise ValueError(f"Path {path} does not exist or is not a file.")
+def derived_inputs(name, pqtls):
+    if name.startswith(HANDSHAKE_PQM4_PREFIX):
+        return ["cycles_connect_" + name[len(HANDSHAKE_PQM4_PREFIX):]] + (PQTLS_PQM4_CYCLES if pqtls else PQM4_CYCLES)
+    return DERIVED_COLUMN_INPUTS.get(name, [])
+
+
+def required_metrics(columns, pqtls):
+    """
+    Names of the benchmarks to read from the files for the given table
+    columns, including the inputs of derived columns.
+    """
+    required = {"CMD_finish_success", "calibration_key"}
+    todo = list(columns)
+    while todo:
+        name = todo.pop()
+        if name in required:
+            continue
+        required.add(name)
+        todo.extend(derived_inputs(name, pqtls))
+    return required
 
+
+def read_benchmark_file(path, metrics=None):
+    """Parses a run file. If metrics is given, all other lines are skipped."""
     benchmarks = {}
 
-    with open(path) as f:
-        for l in f.readlines():
-            name, val = l.strip().split(",")
-            if val.isnumeric():
-                val = int(val)
-            benchmarks[name] = val
+    try:
+        f = open(path)
+    except OSError:
+        raise ValueError(f"Path {path} does not exist or is not a file.")
+    with f:
+        for l in f:
+            name, _, val = l.strip().partition(",")
+            if metrics is not None and name not in metrics:
+                continue
+            benchmarks[name] = parse_value(val, name)
 
     return benchmarks
 
 
-def get_benchmarks(path, pqtls=False):
+def read_benchmark_files(path, fnames, jobs=None, use_cache=True, metrics=None):
+    """
+    Yields the benchmarks of all given files of directory path in order,
+    only the given metrics if not None. Files that did not change since the
+    last call are taken from the parse cache if the entry holds all
+    requested metrics, the others are parsed, by a process pool if there
+    are many of them and more than one CPU.
+    """
+    cache = ParseCache(path) if use_cache else None
+    metrics = frozenset(metrics) if metrics is not None else None
+    cached = [None] * len(fnames)
+    todo = []
+
+    for i, fname in enumerate(fnames):
+        # Only the cache needs mtime and size
+        stat = os.stat(os.path.join(path, fname)) if cache else None
+        entry = cache.get(fname, stat) if cache else None
+        # Entries are (parsed metrics or None for all, benchmarks)
+        if entry is None or entry[0] is not None and (metrics is None or not metrics <= entry[0]):
+            todo.append((i, stat))
+        elif metrics is not None and entry[0] != metrics:
+            cached[i] = {name: val for name, val in entry[1].items() if name in metrics}
+        else:
+            cached[i] = entry[1]
+
+    paths = [os.path.join(path, fnames[i]) for i, _ in todo]
+    # More workers than CPUs only add overhead
+    jobs = min(jobs or os.cpu_count() or 1, os.cpu_count() or 1)
+    with ExitStack() as stack:
+        if len(paths) >= PARALLEL_MIN_FILES and jobs > 1:
+            log(f"Parsing {len(paths)} files in parallel.")
+            executor = stack.enter_context(ProcessPoolExecutor(jobs))
+            parsed = executor.map(read_benchmark_file, paths, repeat(metrics), chunksize=64)
+        else:
+            # Parsed one by one as they are consumed
+            parsed = map(read_benchmark_file, paths, repeat(metrics))
+
+        todo = iter(todo)
+        pending = next(todo, None)
+        for i, fname in enumerate(fnames):
+            if pending is None or pending[0] != i:
+                yield cached[i]
+                cached[i] = None
+                continue
+            benchmarks = next(parsed)
+            if cache:
+                cache.put(fname, pending[1], (metrics, benchmarks))
+            pending = next(todo, None)
+            yield benchmarks
+
+    if cache:
+        cache.prune(fnames)
+        cache.save()
+
+
+def static_benchmarks(combination, pqtls, stack=STACK_BENCHMARKS):
+    """Values that are not measured but known per algorithm (stack usage), added once per run."""
+    # For PQTLS, sig is the root and leaf the leaf certificate's signature
+    kex_alg, cert_sig_alg, cert_leaf_alg = combination
+
+    static = {}
+    if pqtls:
+        static["wc_pq_verify_hash_0_stack"] = stack[cert_sig_alg]["verify_hash_stack"]
+        static["wc_pq_verify_hash_1_stack"] = stack[cert_leaf_alg]["verify_hash_stack"]
+        static["kex_stack"] = max(
+            stack[kex_alg]["wc_pq_make_keypair_stack"],
+            stack[kex_alg]["wc_pq_kem_dec_stack"],
+            stack[kex_alg]["wc_pq_kem_enc_stack"]
+        )
+
+        if cert_sig_alg == "rainbowIclassic" or cert_leaf_alg == "rainbowIclassic":
+            static["peak_mem"] = RAINBOW_PK_SIZE
+    else:
+        static["wc_pq_verify_hash_stack"] = stack[cert_sig_alg]["verify_hash_stack"]
+        static["wc_pq_kem_stack"] = max(
+            stack[cert_leaf_alg]["wc_pq_make_keypair_stack"],
+            stack[cert_leaf_alg]["wc_pq_kem_dec_stack"],
+            stack[cert_leaf_alg]["wc_pq_kem_enc_stack"]
+        )
+        static["kex_stack"] = max(
+            stack[kex_alg]["wc_pq_make_keypair_stack"],
+            stack[kex_alg]["wc_pq_kem_dec_stack"],
+            stack[kex_alg]["wc_pq_kem_enc_stack"]
+        )
+
+        if cert_sig_alg == "rainbowIclassic":
+            static["peak_mem"] = RAINBOW_PK_SIZE
+    return static
+
+
+def read_runs(path, pqtls=False, jobs=None, use_cache=True, metrics=None):
+    """
+    Yields (file name, (kex, sig, leaf, testcase), benchmarks) of every run
+    in path, with only the given metrics if not None. Raises on the first
+    run that did not finish successfully.
+    """
     if not os.path.exists(path):
         raise ValueError(f"Path {path} does not exist.")
 
-    benchmarks_collected = ddict(lambda: ddict(lambda: list()))
-
-    for fname in os.listdir(path):
-        try:
-            if pqtls:
-                cert_root_alg, cert_leaf_alg, kex_alg, testcase_num = re.findall(PQTLS_BENCHMARK_FILE_RE, fname)[0]
-            else:
-                kex_alg, cert_sig_alg, cert_kem_alg, testcase_num = re.findall(BENCHMARK_FILE_RE, fname)[0]
-        except IndexError:
-            log(f"Filename doesn't fullfil regex, ignoring: {fname}")
-            continue
-
-        benchmarks = read_benchmark_file(os.path.join(path, fname))
-
+    if is_archive(path):
+        runs = []
+        for profile, fname, benchmarks in BenchmarkArchive(path).runs(metrics):
+            if profile:
+                raise ValueError(f"Archive {path} contains unmerged runs. Merge it first.")
+            try:
+                runs.append((fname, parse_run_fname(fname, pqtls), benchmarks))
+            except ValueError:
+                log(f"Filename is no benchmark file name, ignoring: {fname}")
+    else:
+        fnames = []
+        all_dims = []
+        for fname in os.listdir(path):
+            try:
+                all_dims.append(parse_run_fname(fname, pqtls))
+                fnames.append(fname)
+            except ValueError:
+                log(f"Filename is no benchmark file name, ignoring: {fname}")
+        # The files go first, zip then runs read_benchmark_files to its end where it saves the cache
+        runs = ((fname, dims, benchmarks) for benchmarks, fname, dims in
+                zip(read_benchmark_files(path, fnames, jobs, use_cache, metrics), fnames, all_dims))
+
+    for fname, dims, benchmarks in runs:
         if benchmarks["CMD_finish_success"] != "y":
             raise ValueError(f"Benchmark in file {fname} did not run successfully! Exiting!")
-
-        if pqtls:
-            stack_usage_0 = STACK_BENCHMARKS[cert_root_alg]["verify_hash_stack"]
-            stack_usage_1 = STACK_BENCHMARKS[cert_leaf_alg]["verify_hash_stack"]
-            stack_usage_kex = max(
-                STACK_BENCHMARKS[kex_alg]["wc_pq_make_keypair_stack"],
-                STACK_BENCHMARKS[kex_alg]["wc_pq_kem_dec_stack"],
-                STACK_BENCHMARKS[kex_alg]["wc_pq_kem_enc_stack"]
-            )
-            benchmarks_collected[f"{kex_alg}_{cert_root_alg}_{cert_leaf_alg}"]["wc_pq_verify_hash_0_stack"].append(stack_usage_0)
-            benchmarks_collected[f"{kex_alg}_{cert_root_alg}_{cert_leaf_alg}"]["wc_pq_verify_hash_1_stack"].append(stack_usage_1)
-            benchmarks_collected[f"{kex_alg}_{cert_root_alg}_{cert_leaf_alg}"]["kex_stack"].append(stack_usage_kex)
-
-            if cert_root_alg == "rainbowIclassic" or cert_leaf_alg == "rainbowIclassic":
-                benchmarks_collected[f"{kex_alg}_{cert_root_alg}_{cert_leaf_alg}"]["peak_mem"].append(RAINBOW_PK_SIZE)
-        else:
-            stack_usage_0 = STACK_BENCHMARKS[cert_sig_alg]["verify_hash_stack"]
-            stack_usage_kex = max(
-                STACK_BENCHMARKS[kex_alg]["wc_pq_make_keypair_stack"],
-                STACK_BENCHMARKS[kex_alg]["wc_pq_kem_dec_stack"],
-                STACK_BENCHMARKS[kex_alg]["wc_pq_kem_enc_stack"]
-            )
-            stack_usage_cert_kem = max(
-                STACK_BENCHMARKS[cert_kem_alg]["wc_pq_make_keypair_stack"],
-                STACK_BENCHMARKS[cert_kem_alg]["wc_pq_kem_dec_stack"],
-                STACK_BENCHMARKS[cert_kem_alg]["wc_pq_kem_enc_stack"]
-            )
-            benchmarks_collected[f"{kex_alg}_{cert_sig_alg}_{cert_kem_alg}"]["wc_pq_verify_hash_stack"].append(stack_usage_0)
-            benchmarks_collected[f"{kex_alg}_{cert_sig_alg}_{cert_kem_alg}"]["wc_pq_kem_stack"].append(stack_usage_cert_kem)
-            benchmarks_collected[f"{kex_alg}_{cert_sig_alg}_{cert_kem_alg}"]["kex_stack"].append(stack_usage_kex)
-
-            if cert_sig_alg == "rainbowIclassic":
-                benchmarks_collected[f"{kex_alg}_{cert_sig_alg}_{cert_kem_alg}"]["peak_mem"].append(RAINBOW_PK_SIZE)
+        yield fname, dims, benchmarks
+
+
+def get_runs(path, pqtls=False, jobs=None, use_cache=True, metrics=None):
+    """
+    Returns a RunRecord of every successful run in path, with only the
+    given metrics if not None.
+    """
+    protocol = PROTOCOL_PQTLS if pqtls else PROTOCOL_KEMTLS
+    return [RunRecord.from_benchmarks(protocol, dims, benchmarks) for _, dims, benchmarks in read_runs(path, pqtls, jobs, use_cache, metrics)]
+
+
+def resolve_calibration(keys, pqtls, key=None):
+    """
+    (text base size, stack benchmarks, rom_size_wolfssl_wo_pqm4 or None) of
+    the calibration the runs were built with, keys holds their
+    calibration_key (None if missing, see calibration.py), or of key. Falls
+    back to the constants above if there is no single cached calibration.
+    """
+    text_base_size = PQTLS_TEXT_BASE_SIZE if pqtls else KEMTLS_TEXT_BASE_SIZE
+    if key is None:
+        keys = set(keys) - {None}
+        if not keys:
+            return text_base_size, STACK_BENCHMARKS, None
+        if len(keys) > 1:
+            log(f"Runs were built with {len(keys)} different calibration keys, using the fixed baselines.")
+            return text_base_size, STACK_BENCHMARKS, None
+        key = keys.pop()
+
+    calibration = load_calibration(key)
+    if calibration is None:
+        log(f"No calibration {key} cached, using the fixed baselines. See calibration.py measure.")
+        return text_base_size, STACK_BENCHMARKS, None
+
+    # Schemes that were not measured keep the published figures
+    measured = calibration.get("stack", {})
+    stack = {alg: dict(figures, **measured.get(alg, {})) for alg, figures in STACK_BENCHMARKS.items()}
+    for alg, figures in measured.items():
+        stack.setdefault(alg, figures)
+    return calibration.get("text_base_size", text_base_size), stack, calibration.get("rom_size_wolfssl_wo_pqm4")
+
+
+def get_benchmarks(path, pqtls=False, jobs=None, use_cache=True, metrics=None, calibration=None):
+    benchmarks_collected = ddict(lambda: ddict(lambda: list()))
+    num_runs = {}
+    keys = set()
+
+    # Runs are collected as they are read. The static and calibrated values
+    # are only known after the last run, their lists are created up front to
+    # keep the metric order and filled in below.
+    for _, dims, benchmarks in read_runs(path, pqtls, jobs, use_cache, metrics):
+        comb = tuple(dims[:3])
+        collected = benchmarks_collected[comb]
+        if comb not in num_runs:
+            num_runs[comb] = 0
+            for name in static_benchmarks(comb, pqtls):
+                collected[name]
+            collected["rom_size_wolfssl_wo_pqm4"]
+        num_runs[comb] += 1
+        keys.add(benchmarks.get("calibration_key"))
 
         for name, val in benchmarks.items():
             if name == "elf_text_size":
-                # Find PQM4 size, including ASM, by comapring to binary without PQM4
-                if pqtls:
-                    benchmarks_collected[f"{kex_alg}_{cert_root_alg}_{cert_leaf_alg}"]["rom_size_PQM4_calculated"].append(val - PQTLS_TEXT_BASE_SIZE)
-                else:
-                    benchmarks_collected[f"{kex_alg}_{cert_sig_alg}_{cert_kem_alg}"]["rom_size_PQM4_calculated"].append(val - KEMTLS_TEXT_BASE_SIZE)
+                collected["rom_size_PQM4_calculated"].append(val)
 
-            if pqtls:
-                benchmarks_collected[f"{kex_alg}_{cert_root_alg}_{cert_leaf_alg}"][name].append(val)
-            else:
+            collected[name].append(val)
+
+    text_base_size, stack, rom_size_wolfssl_wo_pqm4 = resolve_calibration(keys, pqtls, calibration)
 
-                benchmarks_collected[f"{kex_alg}_{cert_sig_alg}_{cert_kem_alg}"][name].append(val)
+    for comb, n in num_runs.items():
+        collected = benchmarks_collected[comb]
+        for name, val in static_benchmarks(comb, pqtls, stack).items():
+            # Before measured values of the same metric, e.g. peak_mem of Rainbow
+            collected[name][:0] = [val] * n
+        if rom_size_wolfssl_wo_pqm4 is None:
+            del collected["rom_size_wolfssl_wo_pqm4"]
+        else:
+            collected["rom_size_wolfssl_wo_pqm4"] = [rom_size_wolfssl_wo_pqm4] * n
+        if "rom_size_PQM4_calculated" in collected:
+            # Find PQM4 size, including ASM, by comapring to binary without PQM4
+            collected["rom_size_PQM4_calculated"] = [val - text_base_size for val in collected["rom_size_PQM4_calculated"]]
 
     return benchmarks_collected
 
 
-def build_average(benchmarks):
-    averaged_benchmarks = ddict(lambda: dict())
-    for comb in benchmarks:
-        # First iteration has all benchmarks
-        for bench_name, vals in benchmarks[comb].items():
-            if bench_name.startswith("CMD"):
-                continue
-            averaged_benchmarks[comb][bench_name] = sum(vals)/len(vals)
+def build_average(benchmarks, stat="mean", outliers=None, outlier_metrics=DEFAULT_OUTLIER_METRICS):
+    """
+    Aggregates all runs of each combination with the given statistic
+    (mean, median, std, min, max, n, mad, trimmed[NN] or a percentile
+    like p95). If outliers is given as (method, threshold), outliers of the
+    outlier_metrics are dropped first and a report is logged.
+    """
+    frame = BenchmarkFrame.from_collected(benchmarks)
+    if outliers:
+        report = frame.reject_outliers(*outliers, outlier_metrics)
+        log_outlier_report(report)
+    return ddict(lambda: dict(), frame.to_dict(stat))
 
-    return averaged_benchmarks
+
+def log_outlier_report(report):
+    dropped = total = 0
+    for comb, res in sorted(report.items()):
+        dropped += sum(n for n, _ in res["metrics"].values())
+        total += sum(count for _, count in res["metrics"].values())
+        details = ", ".join(f"{metric}: {n} of {count}" for metric, (n, count) in res["metrics"].items() if n)
+        if details:
+            log(f"{'_'.join(comb)}: dropped outliers ({res['reason']}): {details}")
+    log(f"Outlier values in total: {dropped} of {total}")
 
 
 def round_bignum(num, latex=False):
@@ -246,7 +460,7 @@ def build_table(averaged_bench, desired_benchmarks, round_res=True, latex=False)
     combinations = sorted(averaged_bench.keys())
 
     for comb in combinations:
-        row = comb.split("_")
+        row = list(comb)
         for bname in des_b:
             try:
                 avg_val = averaged_bench[comb][bname]
@@ -263,9 +477,9 @@ def build_table(averaged_bench, desired_benchmarks, round_res=True, latex=False)
 
     return field_names, rows
 
-def print_table(field_names, rows, csv=False, format="pretty"):
+def print_table(field_names, rows, csv=False, format="pretty", header=True):
     if csv:
-        table = [",".join(field_names),]
+        table = [",".join(field_names),] if header else []
         for row in rows:
             fields = []
             for f in row:
@@ -275,7 +489,8 @@ def print_table(field_names, rows, csv=False, format="pretty"):
                     else:
                         fields.append(str(f))
                 else:
-                    fields.append(f)
+                    # int cells, e.g. of --stat n
+                    fields.append(str(f))
             table.append(",".join(fields))
         table = "\n".join(table)
     else:
@@ -283,42 +498,211 @@ def print_table(field_names, rows, csv=False, format="pretty"):
 
     print(table)
 
-def calc_additional_columns(benchmarks, pqtls):
-
+def calc_additional_columns(benchmarks, pqtls, columns=None):
+    """
+    Adds the derived columns to the averaged benchmarks. If columns is given
+    (see required_metrics), only the derived columns in it are added.
+    """
+    def wanted(name):
+        return columns is None or name in columns
 
     for alg_comb, bench in benchmarks.items():
         # Size of wolfssl without PQM4
         # Set fixed value for now, as they only differ by very little, but are still confusing when looking at the percentages (e.g certificate percent)
-        bench["rom_size_wolfssl_wo_pqm4"] = 111216. # bench["rom_size_wolfssl"] - bench["rom_size_PQM4"] - bench["rom_size_ca_cert"]
+        # Measured from the reference build if the runs are calibrated (see calibration.py)
+        if wanted("rom_size_wolfssl_wo_pqm4"):
+            bench.setdefault("rom_size_wolfssl_wo_pqm4", 111216.) # bench["rom_size_wolfssl"] - bench["rom_size_PQM4"] - bench["rom_size_ca_cert"]
         # wolfssl size, also with asm routines
-        bench["rom_size_wolfssl_complete"] = bench["rom_size_wolfssl_wo_pqm4"] + bench["rom_size_PQM4_calculated"]
+        if wanted("rom_size_wolfssl_complete"):
+            bench["rom_size_wolfssl_complete"] = bench["rom_size_wolfssl_wo_pqm4"] + bench["rom_size_PQM4_calculated"]
         # Percent Size of PQM4 in Wolfssl
-        bench["pqm4_code_wo_cert"] = bench["rom_size_PQM4_calculated"] - bench["rom_size_ca_cert"]
-        bench["pqm4_code_percent"] = bench["pqm4_code_wo_cert"] / bench["rom_size_wolfssl_complete"]
+        if wanted("pqm4_code_wo_cert"):
+            bench["pqm4_code_wo_cert"] = bench["rom_size_PQM4_calculated"] - bench["rom_size_ca_cert"]
+        if wanted("pqm4_code_percent"):
+            bench["pqm4_code_percent"] = bench["pqm4_code_wo_cert"] / bench["rom_size_wolfssl_complete"]
         # Percent Size of Cert in Wolfssl
-        bench["certificate_percent"] = bench["rom_size_ca_cert"] / bench["rom_size_wolfssl_complete"]
-        bench["bytes_traffic"] = bench["bytes_send"] + bench["bytes_received"]
+        if wanted("certificate_percent"):
+            bench["certificate_percent"] = bench["rom_size_ca_cert"] / bench["rom_size_wolfssl_complete"]
+        if wanted("bytes_traffic"):
+            bench["bytes_traffic"] = bench["bytes_send"] + bench["bytes_received"]
 
-
-
-        for name in ["1mbit_13msdelay", "1mbit_60msdelay", "46kbit_1500msdelay",]:
-            bname = "handshake_cycles_spend_in_pqm4" + "_" + name
-            source_bname = "cycles_connect_" + name
+        if wanted("wolfssl_max_mem_usage"):
             if not pqtls:
                 bench["wolfssl_max_mem_usage"] = bench["peak_mem"] + max(bench["wc_pq_verify_hash_stack"], bench["kex_stack"], bench["wc_pq_kem_stack"])
-                # Percent of how many percent of cycles are spend within PQM4
-                bench[bname] = (bench["cycles_wc_pq_make_keypair"] + bench["cycles_wc_pq_kem_dec"] + bench["cycles_wc_pq_verify_hash"] + bench["cycles_wc_pq_kem_encapsulate"]) / bench[source_bname]
             else:
                 bench["wolfssl_max_mem_usage"] = bench["peak_mem"] + max(bench["wc_pq_verify_hash_0_stack"], bench["wc_pq_verify_hash_1_stack"], bench["kex_stack"])
 
-                bench[bname] = (bench["cycles_wc_pq_make_keypair"] + bench["cycles_wc_pq_kem_dec"] + bench["cycles_wc_pq_verify_hash_0"] + bench["cycles_wc_pq_verify_hash_1"]) / bench[source_bname]
+        for name in NETEM_PROFILES:
+            bname = HANDSHAKE_PQM4_PREFIX + name
+            source_bname = "cycles_connect_" + name
+            if wanted(bname):
+                # Percent of how many percent of cycles are spend within PQM4
+                bench[bname] = sum(bench[c] for c in (PQTLS_PQM4_CYCLES if pqtls else PQM4_CYCLES)) / bench[source_bname]
+
+
+class RunFollower:
+    """
+    Adds what is appended to the benchmark files to online statistics, with
+    metrics named like in merged files. A run has one file per profile
+    subdirectory. Its static metrics and the metrics that are not per
+    profile are only taken once, from the profile whose file was seen first.
+    """
+    def __init__(self, root, pqtls, calibration=None):
+        self.root = root
+        self.pqtls = pqtls
+        self.online = OnlineStats()
+        # Bytes read so far per file
+        self.offsets = {}
+        # Lines of files whose run did not finish yet
+        self.pending = {}
+        # File name of a run -> profile whose file was seen first
+        self.runs = {}
+        self.calibration_key = calibration
+        # Of the first run that finished, see resolve_calibration
+        self.calibration = None
+
+    def ingest(self, file_path):
+        """Reads the lines of file_path that were not seen yet. Returns the combination of a finished run or None."""
+        fname = os.path.basename(file_path)
+        try:
+            comb = parse_run_fname(fname, self.pqtls)[:3]
+        except ValueError:
+            return None
+        parent = os.path.dirname(file_path)
+        profile = None if os.path.samefile(parent, self.root) else os.path.basename(parent)
+
+        try:
+            with open(file_path, "rb") as f:
+                offset = self.offsets.get(file_path, 0)
+                if os.fstat(f.fileno()).st_size < offset:
+                    # File was rewritten
+                    offset = 0
+                    self.pending.pop(file_path, None)
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Only complete lines, the rest is read once it was written
+        data = data[:data.rfind(b"\n") + 1]
+        self.offsets[file_path] = offset + len(data)
+        if not data:
+            return None
+
+        self.runs.setdefault(fname, profile)
+        lines = self.pending.setdefault(file_path, [])
+        for line in data.decode().splitlines():
+            name, sep, val = line.strip().partition(",")
+            if sep:
+                lines.append((name, parse_value(val, name)))
+
+        # CMD_finish_success is the last line of a run
+        benchmarks = dict(lines)
+        if "CMD_finish_success" not in benchmarks:
+            return None
+        del self.pending[file_path]
+        if benchmarks["CMD_finish_success"] != "y":
+            raise ValueError(f"Benchmark in file {file_path} did not run successfully! Exiting!")
 
+        if self.calibration is None:
+            self.calibration = resolve_calibration([benchmarks.get("calibration_key")], self.pqtls, self.calibration_key)
+        text_base_size, stack, rom_size_wolfssl_wo_pqm4 = self.calibration
+
+        first = self.runs[fname] == profile
+        if first:
+            for name, val in static_benchmarks(comb, self.pqtls, stack).items():
+                self.online.get(comb, "", name).add(val)
+            if rom_size_wolfssl_wo_pqm4 is not None:
+                self.online.get(comb, "", "rom_size_wolfssl_wo_pqm4").add(rom_size_wolfssl_wo_pqm4)
+
+        for name, val in benchmarks.items():
+            if not isinstance(val, (int, float)):
+                continue
+            if profile:
+                if merged_name(name, profile) == name and not first:
+                    continue
+                name = merged_name(name, profile)
+            self.online.get(comb, "", name).add(val)
+            if name == "elf_text_size":
+                self.online.get(comb, "", "rom_size_PQM4_calculated").add(val - text_base_size)
+
+        return comb
+
+
+def follow(path, pqtls, stat, des_bench, csv, refresh, format, calibration=None):
+    """
+    Watches path (merged layout or profile subdirectories), only reads
+    what was added to the benchmark files and redraws the table every
+    refresh seconds. With csv, the rows that changed are printed instead.
+    """
+    follower = RunFollower(path, pqtls, calibration)
+    online = follower.online
+    derive = is_location_statistic(stat)
+    if not derive:
+        log(f"Derived columns are only computed for mean, median, trimmed and pNN, not for {stat}.")
+    watcher = DirWatcher(path)
+    written = watcher.existing()
+    changed = set()
+    header = True
+    next_draw = time.monotonic()
+
+    while True:
+        for file_path in written:
+            comb = follower.ingest(file_path)
+            if comb:
+                changed.add(comb)
+
+        now = time.monotonic()
+        if changed and now >= next_draw:
+            combs = changed if csv else {comb for comb, _ in online.combinations()}
+            agg = {comb: {} for comb in combs}
+            for (comb, _, metric), stats in online.entries.items():
+                if comb in agg:
+                    agg[comb][metric] = stats.stat(stat)
+            if derive:
+                for comb, bench in agg.items():
+                    try:
+                        calc_additional_columns({comb: bench}, pqtls)
+                    except KeyError:
+                        # Not all benchmarks of the combination have arrived yet
+                        pass
+
+            field_names, rows = build_table(agg, des_bench, not csv)
+            if not csv:
+                print("\033[H\033[2J", end="")
+            print_table(field_names, rows, csv, format, header)
+            if not csv:
+                print(f"{len(follower.offsets)} files, updated {time.strftime('%H:%M:%S')}")
+            sys.stdout.flush()
+
+            header = False
+            changed = set()
+            next_draw = now + refresh
+
+        written = watcher.wait(max(0., next_draw - time.monotonic()) if changed else refresh)
+
+
+def usage():
+    log(f"Call: {sys.argv[0]} BENCHMARKS_DIR|ARCHIVE [--stat mean|median|std|min|max|n|mad|trimmedNN|pNN] [--outliers mad[:K]|iqr[:K]] [--outlier-metrics PATTERNS] [--jobs N] [--no-cache] [--calibration KEY] [--follow [--refresh SECONDS]]")
+    sys.exit(1)
+
+
+def get_option(name, default=None):
+    for i, arg in enumerate(sys.argv):
+        if arg == name:
+            if i + 1 == len(sys.argv):
+                log(f"Error, {name} needs a value.")
+                usage()
+            return sys.argv[i + 1]
+        if arg.startswith(name + "="):
+            return arg[len(name) + 1:]
+    return default
 
 
 def main():
     if len(sys.argv) < 2:
-        log(f"Error, missing argument. Call: {sys.argv[0]} BENCHMARKS_DIR")
-        sys.exit(1)
+        log("Error, missing argument.")
+        usage()
 
     # Wow, I'm lazy today... Well, my head hurts...
     pqtls = "--pqtls" in sys.argv
@@ -326,10 +710,51 @@ def main():
     paper_tables = "--paper" in sys.argv
     latex = "--latex" in sys.argv
     all = "--all" in sys.argv
-    benchmarks = get_benchmarks(sys.argv[1], pqtls)
+    stat = get_option("--stat", "mean")
+    if not is_statistic(stat):
+        log(f"Unknown statistic {stat}.")
+        sys.exit(1)
+    try:
+        outlier_spec = get_option("--outliers")
+        outliers = parse_outlier_method(outlier_spec) if outlier_spec else None
+    except ValueError as e:
+        log(e)
+        sys.exit(1)
+    outlier_metrics = get_option("--outlier-metrics", ",".join(DEFAULT_OUTLIER_METRICS)).split(",")
+    jobs = get_option("--jobs")
+    use_cache = "--no-cache" not in sys.argv
 
-    avg = build_average(benchmarks)
-    calc_additional_columns(avg, pqtls)
+    if "--follow" in sys.argv:
+        if all:
+            log("--all is not supported with --follow.")
+            sys.exit(1)
+        if stat not in FOLLOW_STATISTICS and not re.match(PERCENTILE_RE, stat):
+            log(f"--follow supports the statistics {', '.join(FOLLOW_STATISTICS)} and pNN.")
+            sys.exit(1)
+        des_bench = PQTLS_DESIRED_BENCHMARKS if pqtls else DESIRED_BENCHMARKS
+        try:
+            follow(sys.argv[1], pqtls, stat, des_bench, csv, float(get_option("--refresh", 5)), "latex_raw" if latex else "pretty",
+                   get_option("--calibration"))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Only parse what the tables show
+    if paper_tables:
+        columns = required_metrics(PQTLS_PAPER_TABLE1 + PQTLS_PAPER_TABLE2, pqtls)
+    elif not all:
+        columns = required_metrics(PQTLS_DESIRED_BENCHMARKS if pqtls else DESIRED_BENCHMARKS, pqtls)
+    else:
+        columns = None
+
+    benchmarks = get_benchmarks(sys.argv[1], pqtls, int(jobs) if jobs else None, use_cache, columns, get_option("--calibration"))
+
+    avg = build_average(benchmarks, stat, outliers, outlier_metrics)
+    if is_location_statistic(stat):
+        calc_additional_columns(avg, pqtls, columns)
+    else:
+        # E.g. the std of a sum is not the sum of the stds
+        log(f"Derived columns are only computed for mean, median, trimmed and pNN, not for {stat}.")
 
     format = "latex_raw" if latex else "pretty"
 
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import sys
 import re
+import time
+import argparse
+import contextlib
 
 try:
     import serial
@@ -8,32 +11,53 @@ except ImportError:
     sys.stderr.write("pyserial not installed.")
     sys.exit(1)
 
+from benchmark_frames import (
+    FRAME_SYNC, FrameError, decode_frame, KIND_BENCHMARK, KIND_CMD, KIND_ERROR
+)
+
 BENCHMARK_PREFIX="[benchmark]"
 BENCHMARK_CMD_PREFIX="[benchmark_cmd]"
 BENCHMARK_ERROR_PREFIX="[benchmark_error]"
+# Wall-clock spans measured on the host, in milliseconds
+HOST_TIMING_PREFIX="host_ms_"
+
+RECORD_KIND_NAMES = {
+    KIND_BENCHMARK: "benchmark",
+    KIND_CMD: "cmd",
+    KIND_ERROR: "error",
+}
+
+DEFAULT_PORTS = ["/dev/ttyACM0", "/dev/ttyACM1"]
+BAUDRATE = 9600
 
 class EXIT_CODES:
     SUCCESS = 0
     ERROR = 1
+    # Board stalled, the orchestrator should reset it and retry
+    TIMEOUT = 2
 
-def handle_command(cmd, cmd_val):
+def handle_command(cmd, cmd_val, log=sys.stderr):
     finish = None
     exit_code = None
     if cmd == "finish_success":
-        sys.stderr.write("Received FINISHED command. Exiting.")
+        log.write("Received FINISHED command. Exiting.")
         finish = True
         if cmd_val == "y":
             exit_code = EXIT_CODES.SUCCESS
         else:
             exit_code = EXIT_CODES.ERROR
     elif cmd == "error":
-        sys.stderr.write(f"Received ERROR message: {cmd_val}!")
+        log.write(f"Received ERROR message: {cmd_val}!")
         # So far errors are purely informational
         finish = False
-    
+
     return (finish, exit_code)
 
 
+def _to_ms(seconds):
+    return round(seconds * 1000, 3)
+
+
 def _get_kv(line, prefix):
     if line.startswith(prefix):
         benchmark = line[len(prefix):]
@@ -43,38 +67,219 @@ def _get_kv(line, prefix):
     return None
 
 
-def main():
-    try:
-        ser = serial.Serial("/dev/ttyACM0")
-    except Exception:
-        ser = serial.Serial("/dev/ttyACM1")
-    ser.baudrate = 9600
-
-    finished = False
-    exit_code = EXIT_CODES.ERROR
-
-    while not finished:
-        line = ser.read_until()
-        
+class BenchmarkReceiver:
+    """
+    Turns the raw serial output of one board into benchmark result lines.
+
+    Data can be fed in arbitrary chunks, so one receiver per port can be
+    driven by a blocking read loop or by a selector watching many ports.
+    Text lines and binary frames (see benchmark_frames.py) are both accepted.
+
+    read_timeout is the longest the board may stay silent, run_timeout the
+    longest the whole run may take (both in seconds, None disables them).
+
+    All times are taken from the monotonic host clock, relative to reset_time
+    (time.monotonic() taken right before the board was reset) or, if it is
+    not given, to the creation of the receiver. The timeouts always start
+    with the receiver. When the run finishes, the derived spans are emitted
+    as host_ms_* results. If trace is given, every record is also written
+    there as t_ms,kind,name,value.
+    """
+    def __init__(self, out=sys.stdout, log=sys.stderr, read_timeout=None, run_timeout=None, trace=None, reset_time=None):
+        self.out = out
+        self.log = log
+        self.trace = trace
+        self.buffer = b""
+        self.finished = False
+        self.exit_code = EXIT_CODES.ERROR
+        self.read_timeout = read_timeout
+        self.run_timeout = run_timeout
+        self.started = self.last_data = time.monotonic()
+        self.origin = self.started if reset_time is None else reset_time
+        self.first_data = None
+        self.spans = {}
+        self.last_marker = None
+
+    def time_left(self):
+        """Seconds until the next deadline expires, None if there is none."""
+        deadlines = []
+        if self.read_timeout is not None:
+            deadlines.append(self.last_data + self.read_timeout)
+        if self.run_timeout is not None:
+            deadlines.append(self.started + self.run_timeout)
+        if not deadlines:
+            return None
+        return max(0., min(deadlines) - time.monotonic())
+
+    def check_timeout(self):
+        """Finishes the run with a timeout result if a deadline expired."""
+        if self.finished:
+            return False
+        now = time.monotonic()
+        if self.run_timeout is not None and now >= self.started + self.run_timeout:
+            expired = "run"
+        elif self.read_timeout is not None and now >= self.last_data + self.read_timeout:
+            expired = "read"
+        else:
+            return False
+
+        self.log.write(f"No result within {expired} timeout, giving up.\n")
+        self.handle_record(KIND_CMD, "timeout", expired, now)
+        self.finish(EXIT_CODES.TIMEOUT, now)
+        return True
+
+    def finish(self, exit_code, now):
+        self.finished, self.exit_code = True, exit_code
+        self.spans["total"] = now - self.origin
+        for name, span in self.spans.items():
+            self.emit(HOST_TIMING_PREFIX + name, _to_ms(span))
+
+    def feed(self, data):
+        if data:
+            self.last_data = time.monotonic()
+            if self.first_data is None:
+                self.first_data = self.last_data
+                self.spans["to_first_byte"] = self.first_data - self.origin
+        self.buffer += data
+        while not self.finished and self.buffer:
+            if self.buffer.startswith(FRAME_SYNC):
+                try:
+                    res = decode_frame(self.buffer)
+                except FrameError as e:
+                    self.log.write(f"Corrupt frame ({e}), resyncing.\n")
+                    self.buffer = self.buffer[1:]
+                    continue
+                if res is None:
+                    break
+                (kind, name, val), consumed = res
+                self.buffer = self.buffer[consumed:]
+                self.handle_record(kind, name, val)
+                continue
+
+            end = self.buffer.find(b"\n") + 1
+            sync = self.buffer.find(FRAME_SYNC)
+            if 0 < sync and (end == 0 or sync < end):
+                # Garbage in front of a frame, e.g. after a corrupt frame
+                end = sync
+            if end == 0:
+                break
+            line, self.buffer = self.buffer[:end], self.buffer[end:]
+            self.handle_line(line)
+
+    def handle_line(self, line):
         try:
             line_dec = line.decode()
-        except UnicodeEncodeError:
-            sys.stderr.write("Could not decode, **ignoring**:", line_dec)
-        
+        except UnicodeDecodeError:
+            self.log.write(f"Could not decode, **ignoring**: {line!r}\n")
+            return
+
         if line_dec.startswith(BENCHMARK_PREFIX):
             name, val = _get_kv(line_dec, BENCHMARK_PREFIX)
-            print(f"{name},{val}")
+            self.handle_record(KIND_BENCHMARK, name, val)
         elif line_dec.startswith(BENCHMARK_CMD_PREFIX):
             name, val = _get_kv(line_dec, BENCHMARK_CMD_PREFIX)
-            print(f"CMD_{name},{val}")
-            finished, exit_code = handle_command(name, val)
+            self.handle_record(KIND_CMD, name, val)
         else:
-            sys.stderr.write("[DEBUG] " + line_dec)
-        
+            self.log.write("[DEBUG] " + line_dec)
+
+    def handle_record(self, kind, name, val, now=None):
+        # Records are stamped with the arrival of the chunk that completed them
+        now = self.last_data if now is None else now
+        if self.trace:
+            self.trace.write(f"{_to_ms(now - self.origin)},{RECORD_KIND_NAMES[kind]},{name},{val}\n")
+
+        if kind == KIND_BENCHMARK:
+            if self.last_marker is None:
+                self.spans["to_first_benchmark"] = now - self.origin
+                self.last_marker = now
+            self.emit(name, val)
+        elif kind == KIND_CMD:
+            # Time since the previous command marker (or the first benchmark)
+            span = f"CMD_{name}"
+            # Repeated commands (e.g. several errors) get numbered spans
+            repeat = 2
+            while span in self.spans:
+                span = f"CMD_{name}_{repeat}"
+                repeat += 1
+            self.spans[span] = now - (self.last_marker or self.origin)
+            self.last_marker = now
+
+            self.emit(f"CMD_{name}", val)
+            finished, exit_code = handle_command(name, val, self.log)
+            if finished:
+                self.finish(exit_code, now)
+        elif kind == KIND_ERROR:
+            # Same as text error lines, purely informational
+            self.log.write(f"[DEBUG] {BENCHMARK_ERROR_PREFIX} {name}: {val}\n")
+
+    def emit(self, name, val):
+        self.out.write(f"{name},{val}\n")
+        self.out.flush()
+
+
+def open_serial(port=None, **kwargs):
+    ports = [port] if port else DEFAULT_PORTS
+    for i, p in enumerate(ports):
+        try:
+            ser = serial.Serial(p, **kwargs)
+            break
+        except Exception:
+            if i == len(ports) - 1:
+                raise
+    ser.baudrate = BAUDRATE
+    return ser
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Receive benchmark results of one board via serial.")
+    parser.add_argument("port", nargs="?", default=None,
+                        help=f"Serial port of the board. Default: first of {', '.join(DEFAULT_PORTS)}.")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help="Append every record with its host timestamp to FILE.")
+    parser.add_argument("--capture", default=None, metavar="FILE",
+                        help="Append the raw serial output to FILE, e.g. for replay_device.py.")
+    parser.add_argument("--reset-time", type=float, default=None, metavar="EPOCH_SECONDS",
+                        help="Wall-clock time (date +%%s.%%N) right before the board was reset, "
+                             "the host spans start there instead of at the start of this script.")
+    add_timeout_args(parser)
+    return parser.parse_args(argv)
+
+
+def add_timeout_args(parser):
+    parser.add_argument("--read-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Give up if the board sends nothing for this long.")
+    parser.add_argument("--run-timeout", type=float, default=None, metavar="SECONDS",
+                        help="Give up if the run did not finish after this long.")
+    parser.epilog = (f"On timeout a CMD_timeout result is written and the exit code is {EXIT_CODES.TIMEOUT}.")
+
+
+def monotonic_from_epoch(epoch_seconds):
+    """time.monotonic() value of the given wall-clock time."""
+    return time.monotonic() - (time.time() - epoch_seconds)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    ser = open_serial(args.port)
+    reset_time = None if args.reset_time is None else monotonic_from_epoch(args.reset_time)
+
+    with contextlib.ExitStack() as files:
+        trace = files.enter_context(open(args.trace, "a")) if args.trace else None
+        capture = files.enter_context(open(args.capture, "ab")) if args.capture else None
+        receiver = BenchmarkReceiver(read_timeout=args.read_timeout, run_timeout=args.run_timeout, trace=trace, reset_time=reset_time)
+
+        while not receiver.finished:
+            ser.timeout = receiver.time_left()
+            data = ser.read(ser.in_waiting or 1)
+            if capture:
+                capture.write(data)
+            receiver.feed(data)
+            receiver.check_timeout()
+
     sys.stderr.write("Finished communication.")
-    return exit_code
+    return receiver.exit_code
 
 
 if __name__ == '__main__':
     exit_code = main()
-    sys.exit(exit_code)
\ No newline at end of file
+    sys.exit(exit_code)
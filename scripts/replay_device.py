@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Stand-in for a board: replays captured board output on a pseudo terminal.
+
+Captures are either raw serial output as written by
+`recv_benchmarks.py --capture FILE`, or benchmark result files (name,value
+lines), which are turned back into the text the board would have printed.
+The path of the pseudo terminal is printed on the first line of stdout,
+so the host tooling can be pointed at it:
+
+    scripts/replay_device.py capture.raw --speedup 100 --repeat 1000 --link /tmp/ttyREPLAY &
+    scripts/recv_benchmarks.py /tmp/ttyREPLAY
+
+Each capture is replayed once a reader opened the port (pyserial flushes
+the input on open), which plays the role of restart_device.sh resetting
+the board. With --trigger, every SIGUSR1 replays the next capture instead.
+"""
+import os
+import sys
+import pty
+import tty
+import time
+import fcntl
+import signal
+import termios
+import argparse
+import struct
+
+from recv_benchmarks import BENCHMARK_PREFIX, BENCHMARK_CMD_PREFIX, HOST_TIMING_PREFIX, BAUDRATE
+
+CHUNK_SIZE = 64
+# Results not printed by the board itself, but added by the host scripts
+HOST_RESULT_PREFIXES = ("rom_size_", "elf_text_size", HOST_TIMING_PREFIX)
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+def results_to_board_output(content):
+    """Turns a name,value result file back into what the board printed."""
+    lines = ["*** Booting Zephyr OS (replay) ***"]
+    for line in content.splitlines():
+        name, _, val = line.strip().partition(",")
+        if not name or name.startswith(HOST_RESULT_PREFIXES):
+            continue
+        if name.startswith("CMD_"):
+            lines.append(f"{BENCHMARK_CMD_PREFIX} {name[len('CMD_'):]}: {val}")
+        else:
+            lines.append(f"{BENCHMARK_PREFIX} {name}: {val}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def load_capture(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    try:
+        text = content.decode()
+    except UnicodeDecodeError:
+        return content
+    first = text.lstrip().split("\n", 1)[0]
+    if "," in first and not first.startswith("["):
+        return results_to_board_output(text)
+    return content
+
+
+def open_pty(link=None):
+    master, slave = pty.openpty()
+    # No echo and no CR/NL translation, binary frames must arrive untouched
+    tty.setraw(slave)
+    # Packet mode tells us when the reader flushes its input, i.e. opens the port
+    fcntl.ioctl(master, termios.TIOCPKT, struct.pack("i", 1))
+    path = os.ttyname(slave)
+    if link:
+        if os.path.islink(link):
+            os.unlink(link)
+        os.symlink(path, link)
+        path = link
+    return master, slave, path
+
+
+def wait_for_reader(master):
+    while True:
+        packet = os.read(master, 1024)
+        if packet and packet[0] & termios.TIOCPKT_FLUSHREAD:
+            return
+
+
+def pending_input(slave):
+    return struct.unpack("i", fcntl.ioctl(slave, termios.FIONREAD, b"\0" * 4))[0]
+
+
+def replay(master, data, bytes_per_second):
+    """Writes data paced to the given rate, a rate of None writes at once."""
+    start = time.monotonic()
+    for offset in range(0, len(data), CHUNK_SIZE):
+        chunk = data[offset:offset + CHUNK_SIZE]
+        os.write(master, chunk)
+        if bytes_per_second:
+            due = start + (offset + len(chunk)) / bytes_per_second
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Replay captured board output on a pseudo terminal.")
+    parser.add_argument("captures", nargs="+", metavar="CAPTURE",
+                        help="Raw capture or benchmark result file. Replayed in the given order.")
+    parser.add_argument("--baud", type=int, default=BAUDRATE,
+                        help=f"Baud rate of the emulated link (8N1). Default: {BAUDRATE}.")
+    parser.add_argument("--speedup", type=float, default=1.,
+                        help="Replay this many times faster than the baud rate allows. 0 means unpaced.")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay all captures this many times.")
+    parser.add_argument("--gap", type=float, default=0., metavar="SECONDS",
+                        help="Pause before each capture, e.g. to emulate the boot time.")
+    parser.add_argument("--trigger", action="store_true", help="Wait for SIGUSR1 before each capture.")
+    parser.add_argument("--link", default=None, metavar="PATH", help="Create a symlink to the pseudo terminal.")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    captures = [load_capture(path) for path in args.captures]
+    bytes_per_second = args.baud / 10 * args.speedup if args.speedup else None
+
+    if args.trigger:
+        signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGUSR1])
+
+    master, slave, path = open_pty(args.link)
+    print(path, flush=True)
+    log(f"Replaying {len(captures)} capture(s) {args.repeat} time(s) on {path}")
+
+    started = time.monotonic()
+    total = 0
+    try:
+        for _ in range(args.repeat):
+            for data in captures:
+                if args.trigger:
+                    signal.sigwait([signal.SIGUSR1])
+                else:
+                    wait_for_reader(master)
+                if args.gap:
+                    time.sleep(args.gap)
+                replay(master, data, bytes_per_second)
+                total += len(data)
+
+        # Closing the pty drops everything the reader did not fetch yet
+        while pending_input(slave):
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+        os.close(master)
+        os.close(slave)
+
+    duration = time.monotonic() - started
+    log(f"Replayed {total} bytes in {duration:.2f}s ({total / max(duration, 1e-9):.0f} B/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Compact representation of one benchmark run.
+
+The dimensions of a run (protocol, key exchange, CA signature, leaf KEM or
+leaf signature, testcase, netem profile) are interned string IDs, the
+metrics one float vector in the order of a process wide schema. Missing
+metrics are NaN, text values (e.g. CMD_finish_success) are stored as
+interned string IDs and integer metrics are returned as int again.
+"""
+import sys
+import math
+from array import array
+
+# Algorithms of run_experiments.sh, used to split file names of algorithms with "_"
+KNOWN_ALGORITHMS = [
+    "kyber512",
+    "lightsaber",
+    "ntruhps2048509",
+    "dilithium2",
+    "falcon512",
+    "rainbowIclassic",
+]
+
+PROTOCOL_KEMTLS = "kemtls"
+PROTOCOL_PQTLS = "pqtls"
+
+TYPE_INT = 0
+TYPE_FLOAT = 1
+TYPE_TEXT = 2
+
+
+def log(msg):
+    print("[LOG]", msg, file=sys.stderr)
+
+
+class Interner:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def id(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def string(self, i):
+        return self.strings[i]
+
+
+class MetricSchema:
+    """Metric names in vector order with their type."""
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.types = []
+        # Metrics with numeric and text values, reported once
+        self.mixed = set()
+
+    def slot(self, name, t):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.types.append(t)
+        elif self.types[i] != t:
+            if TYPE_TEXT in (t, self.types[i]):
+                raise ValueError(f"Metric {name} has numeric and text values.")
+            # Integer values are exact as floats
+            self.types[i] = TYPE_FLOAT
+        return i
+
+    def decode(self, i, v):
+        t = self.types[i]
+        if t == TYPE_INT:
+            return int(v)
+        if t == TYPE_TEXT:
+            return STRINGS.string(int(v))
+        return v
+
+
+STRINGS = Interner()
+SCHEMA = MetricSchema()
+
+
+class RunRecord:
+    __slots__ = ("protocol", "kex", "sig", "leaf", "testcase", "profile", "values")
+
+    def __init__(self, protocol, kex, sig, leaf, testcase, profile=""):
+        self.protocol = STRINGS.id(protocol)
+        self.kex = STRINGS.id(kex)
+        self.sig = STRINGS.id(sig)
+        self.leaf = STRINGS.id(leaf)
+        self.testcase = int(testcase)
+        self.profile = STRINGS.id(profile)
+        self.values = array("d")
+
+    @classmethod
+    def from_benchmarks(cls, protocol, dims, benchmarks, profile=""):
+        """dims as returned by parse_run_fname, benchmarks {name: value}."""
+        record = cls(protocol, *dims, profile)
+        # Runs mostly have the metrics seen so far, set only grows for new ones
+        record.values = array("d", [math.nan]) * len(SCHEMA.names)
+        for name, val in benchmarks.items():
+            record.set(name, val)
+        return record
+
+    @property
+    def combination(self):
+        """(kex, sig, leaf), the CA signature is the root signature for PQTLS."""
+        return STRINGS.string(self.kex), STRINGS.string(self.sig), STRINGS.string(self.leaf)
+
+    @property
+    def fname(self):
+        kex, sig, leaf = self.combination
+        if STRINGS.string(self.protocol) == PROTOCOL_PQTLS:
+            return f"{sig}_{leaf}_{kex}_{self.testcase}.txt"
+        return f"{kex}_{sig}_{leaf}_{self.testcase}.txt"
+
+    def set(self, name, val):
+        """Sets metric name to val. A value whose type conflicts with the metric's is stored as missing."""
+        try:
+            if isinstance(val, str):
+                i = SCHEMA.slot(name, TYPE_TEXT)
+                val = STRINGS.id(val)
+            else:
+                i = SCHEMA.slot(name, TYPE_FLOAT if isinstance(val, float) else TYPE_INT)
+        except ValueError as e:
+            if name not in SCHEMA.mixed:
+                SCHEMA.mixed.add(name)
+                log(f"{e} Storing {val!r} of {self.fname} and other conflicting values as missing.")
+            return
+        if i >= len(self.values):
+            self.values.extend([math.nan] * (i + 1 - len(self.values)))
+        self.values[i] = val
+
+    def get(self, name, default=None):
+        i = SCHEMA.index.get(name)
+        if i is None or i >= len(self.values) or math.isnan(self.values[i]):
+            return default
+        return SCHEMA.decode(i, self.values[i])
+
+    def items(self):
+        """(name, value) of all metrics of the run, in schema order."""
+        for i, v in enumerate(self.values):
+            if not math.isnan(v):
+                yield SCHEMA.names[i], SCHEMA.decode(i, v)
+
+
+def split_algorithms(parts, known=KNOWN_ALGORITHMS):
+    """
+    Splits the "_" separated parts of a file name into three algorithm
+    names. Known names may contain "_", unknown ones may not.
+    """
+    candidates = []
+    for i in range(1, len(parts) - 1):
+        for j in range(i + 1, len(parts)):
+            candidates.append(["_".join(parts[:i]), "_".join(parts[i:j]), "_".join(parts[j:])])
+    matching = [names for names in candidates if all(name in known for name in names)]
+    if len(matching) == 1:
+        return matching[0]
+    if len(parts) == 3:
+        return parts
+    raise ValueError(f"Cannot split {'_'.join(parts)} into three algorithms.")
+
+
+def parse_run_fname(fname, pqtls=False, known=KNOWN_ALGORITHMS):
+    """
+    kyber512_falcon512_lightsaber_3.txt -> (kex, sig, leaf, testcase).
+    KEMTLS files are named kex_sig_kem_N.txt, PQTLS files root_leaf_kex_N.txt.
+    """
+    if not fname.endswith(".txt"):
+        raise ValueError(f"{fname} is not a benchmark file.")
+    stem, _, testcase = fname[:-len(".txt")].rpartition("_")
+    if not testcase.isdigit():
+        raise ValueError(f"{fname} has no testcase number.")
+    first, second, third = split_algorithms(stem.split("_"), known)
+    if pqtls:
+        return third, first, second, int(testcase)
+    return first, second, third, int(testcase)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Static worst-case stack depth of the PQC operations of a build.
+
+Reads the call graph GCC writes with -fcallgraph-info=su (.ci files) and
+the frame sizes of -fstack-usage (.su files) below the given build
+directories. The depth of a function is its frame plus the deepest of its
+callees. For every PQM4 scheme and stack figure of print_tables.py the
+depth is computed from the wolfssl wrapper (e.g. wc_pq_kem_dec) if it is
+in the graph, with the functions of all other schemes removed, and from
+the scheme's own API functions (e.g. PQCLEAN_KYBER512_CLEAN_crypto_kem_dec)
+otherwise.
+
+Recursion, indirect calls, dynamic frames and functions without stack
+usage (assembly, libraries) are reported, the result is a lower bound for
+those. With --store KEY the figures are added to calibration KEY (see
+calibration.py), which print_tables.py uses for the memory columns.
+
+Like the published figures, which count Falcon's scratch buffer in .bss,
+the figures of a scheme include its .data and .bss with --elf. Without,
+the figures of STATIC_SCRATCH schemes are left out, so the published
+ones stay.
+
+The build does not add -fstack-usage -fcallgraph-info=su (the build script
+is part of the zephyr-docker submodule), so without them in the build the
+analysis finds no call graph and the published figures are used.
+
+Use:
+    stack_analysis.py BUILD_DIR... [--elf ELF] [--store KEY] [--unknown BYTES] [--csv]
+"""
+import re
+import sys
+import argparse
+from pathlib import Path
+
+from calibration import store_stack
+from elf_size_diff import scheme_of, OTHER
+from elf_sizes import symbol_table, DATA, BSS
+from print_tables import print_table, log
+
+# Stack figures of print_tables.py: (wolfssl wrappers, API functions of the schemes)
+STACK_FIGURES = {
+    "wc_pq_make_keypair_stack": (["wc_pq_make_keypair"], ["crypto_kem_keypair"]),
+    "wc_pq_kem_dec_stack": (["wc_pq_kem_dec"], ["crypto_kem_dec"]),
+    "wc_pq_kem_enc_stack": (["wc_pq_kem_enc", "wc_pq_kem_encapsulate"], ["crypto_kem_enc"]),
+    "verify_hash_stack": (["wc_pq_verify_hash"], ["crypto_sign_verify", "crypto_sign_open"]),
+}
+
+# Schemes whose stack figures include large static buffers, e.g. falcon512's
+# 39936 bytes of scratch in .bss
+STATIC_SCRATCH = ["falcon512"]
+
+INDIRECT_CALL = "__indirect_call"
+
+NODE_RE = r'^node: \{ title: "([^"]+)" label: "([^"]*)"'
+EDGE_RE = r'^edge: \{ sourcename: "([^"]+)" targetname: "([^"]+)"'
+FRAME_RE = r"\\n(\d+) bytes \(([^)]*)\)"
+
+
+class CallGraph:
+    def __init__(self):
+        # {title: (name, file, frame bytes or None, qualifiers)}
+        self.nodes = {}
+        self.edges = {}
+
+    def add_node(self, title, name, file, frame=None, qualifiers=""):
+        known = self.nodes.get(title)
+        # Declarations of functions of other units have no frame
+        if known is None or known[2] is None:
+            self.nodes[title] = (name, file, frame, qualifiers)
+
+    def read_ci(self, path):
+        with open(path) as f:
+            for line in f:
+                m = re.match(NODE_RE, line)
+                if m:
+                    title, label = m.groups()
+                    name, _, rest = label.partition("\\n")
+                    file = rest.split(":", 1)[0]
+                    frame = re.search(FRAME_RE, label)
+                    if frame:
+                        self.add_node(title, name, file, int(frame.group(1)), frame.group(2))
+                    else:
+                        self.add_node(title, name, file)
+                    continue
+                m = re.match(EDGE_RE, line)
+                if m:
+                    self.edges.setdefault(m.group(1), set()).add(m.group(2))
+
+    def read_su(self, path):
+        """Frames of .su files, for functions the .ci files have no frame of."""
+        frames = {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    location, size, qualifiers = line.rstrip("\n").split("\t")
+                except ValueError:
+                    continue
+                file, _, _, name = location.rsplit(":", 3)
+                frames[Path(file).name, name] = (int(size), qualifiers)
+        for title, (name, file, frame, qualifiers) in self.nodes.items():
+            if frame is None and (Path(file).name, name) in frames:
+                self.nodes[title] = (name, file) + frames[Path(file).name, name]
+
+    def find(self, suffixes):
+        """Titles of the functions named like one of suffixes or ending in _suffix."""
+        return [
+            title for title, (name, _, _, _) in self.nodes.items()
+            if any(name == s or name.endswith("_" + s) for s in suffixes)
+        ]
+
+    def depth(self, root, excluded, unknown, problems):
+        """
+        Worst-case stack depth of root without the excluded functions.
+        Recursion, indirect calls and unknown frames are added to problems.
+        """
+        memo = {}
+        active = set()
+
+        def visit(title):
+            if title in memo:
+                return memo[title]
+            name, _, frame, qualifiers = self.nodes.get(title, (title, "", None, ""))
+            if frame is None:
+                problems.add(("no stack usage", name))
+                frame = unknown
+            elif "dynamic" in qualifiers and "bounded" not in qualifiers:
+                problems.add(("dynamic frame", name))
+            active.add(title)
+            deepest = 0
+            for callee in self.edges.get(title, ()):
+                if callee in excluded:
+                    continue
+                if callee == INDIRECT_CALL:
+                    problems.add(("indirect call", name))
+                    continue
+                if callee in active:
+                    problems.add(("recursion", name))
+                    continue
+                deepest = max(deepest, visit(callee))
+            active.discard(title)
+            memo[title] = frame + deepest
+            return memo[title]
+
+        return visit(root)
+
+
+def read_call_graph(directories):
+    graph = CallGraph()
+    su_files = []
+    for directory in directories:
+        for path in sorted(Path(directory).rglob("*.ci")):
+            graph.read_ci(path)
+        su_files += sorted(Path(directory).rglob("*.su"))
+    for path in su_files:
+        graph.read_su(path)
+    return graph
+
+
+def scheme_stacks(graph, unknown=0):
+    """({scheme: {figure: bytes}}, problems)"""
+    schemes = {}
+    for title, (name, file, _, _) in graph.nodes.items():
+        scheme = scheme_of(name, file)
+        if scheme != OTHER:
+            schemes.setdefault(scheme, set()).add(title)
+
+    problems = set()
+    stacks = {}
+    for scheme, own in sorted(schemes.items()):
+        excluded = set().union(*(titles for other, titles in schemes.items() if other != scheme))
+        for figure, (wrappers, api) in STACK_FIGURES.items():
+            entries = [title for title in graph.find(api) if title in own]
+            if not entries:
+                continue
+            roots = graph.find(wrappers) or entries
+            stacks.setdefault(scheme, {})[figure] = max(graph.depth(root, excluded, unknown, problems) for root in roots)
+    return stacks, problems
+
+
+def static_data(table):
+    """{scheme: bytes of its .data and .bss symbols} of an elf_sizes.symbol_table."""
+    sizes = {}
+    for name, kind, _, size, source in table["symbols"]:
+        if kind in (DATA, BSS):
+            scheme = scheme_of(name, source)
+            if scheme != OTHER:
+                sizes[scheme] = sizes.get(scheme, 0) + size
+    return sizes
+
+
+def with_static_data(stacks, static=None):
+    """
+    Adds static {scheme: bytes} to the figures of stacks. Without static,
+    the STATIC_SCRATCH schemes are left out.
+    """
+    if static is None:
+        for scheme in STATIC_SCRATCH:
+            if scheme in stacks:
+                log(f"No ELF for the static scratch of {scheme}, keeping its published figures.")
+        return {scheme: figures for scheme, figures in stacks.items() if scheme not in STATIC_SCRATCH}
+    return {
+        scheme: {figure: depth + static.get(scheme, 0) for figure, depth in figures.items()}
+        for scheme, figures in stacks.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worst-case stack depth of the PQC operations from GCC's stack usage and call graph.")
+    parser.add_argument("dirs", nargs="+", metavar="BUILD_DIR", help="Directory with .ci and .su files (searched recursively)")
+    parser.add_argument("--elf", help="Build whose .data and .bss of the schemes are added to the figures")
+    parser.add_argument("--store", metavar="KEY", help="Add the figures to calibration KEY")
+    parser.add_argument("--unknown", type=int, default=0, help="Bytes assumed for functions without stack usage (default %(default)s)")
+    parser.add_argument("--csv", action="store_true")
+    args = parser.parse_args()
+
+    graph = read_call_graph(args.dirs)
+    if not graph.edges:
+        log("No call graph found. Build with -fstack-usage -fcallgraph-info=su.")
+        sys.exit(1)
+
+    stacks, problems = scheme_stacks(graph, args.unknown)
+    for kind, name in sorted(problems):
+        log(f"{kind}: {name}")
+    stacks = with_static_data(stacks, static_data(symbol_table(args.elf, False)) if args.elf else None)
+    if not stacks:
+        log("No PQM4 scheme functions in the call graph.")
+        sys.exit(1)
+
+    figures = list(STACK_FIGURES)
+    rows = [[scheme] + [stacks[scheme].get(figure, "") for figure in figures] for scheme in sorted(stacks)]
+    print_table(["Scheme"] + figures, rows, args.csv)
+
+    if args.store:
+        store_stack(args.store, stacks)
+        log(f"Stored stack figures in calibration {args.store}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,7 @@
 #ifndef WOLFSSL_PQTLS_CA_H
 #define WOLFSSL_PQTLS_CA_H
 
-const char ca_cert[] = {
-    $ca_cert_hex$
-};
-int ca_cert_len = sizeof(ca_cert);
+$ca_cert_definition$
+int ca_cert_len = $ca_cert_len$;
 
 #endif //WOLFSSL_PQTLS_CA_H